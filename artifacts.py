@@ -0,0 +1,40 @@
+import json
+import os
+import re
+import time
+from typing import Optional
+
+
+class SectionArtifactStore:
+    """Generated sections saved per case, with the hash of the inputs that produced them.
+
+    Layout: `<root>/<case_id>/<section_name>.json` holding
+    {"section", "input_hash", "content", "created_at"}.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, case_id: str, section_name: str) -> str:
+        safe_case = re.sub(r"[^A-Za-z0-9._-]", "_", case_id)
+        return os.path.join(self.root, safe_case, f"{section_name}.json")
+
+    def load(self, case_id: str, section_name: str) -> Optional[dict]:
+        path = self._path(case_id, section_name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: ignoring unreadable artifact {path}: {e}")
+            return None
+
+    def save(self, case_id: str, section_name: str, input_hash: str, content: str):
+        path = self._path(case_id, section_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"section": section_name, "input_hash": input_hash, "content": content,
+                       "created_at": time.time()}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
+
+from main import CHARGESHEET_SECTIONS, generate_case_chargesheet, output_path_for, section_header
+
+
+# --- 1. INPUT ---
+def read_case_ids(path: str) -> List[str]:
+    """Case ids from a text file (one per line, `#` comments allowed) or a
+    JSONL file whose lines are objects with a "case_id" field. Duplicates
+    are dropped, first occurrence wins."""
+    case_ids = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    case_id = json.loads(line).get("case_id")
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_no}: invalid JSON: {e}")
+                if not case_id:
+                    raise ValueError(f"{path}:{line_no}: missing case_id")
+                case_ids.append(str(case_id))
+            else:
+                case_ids.append(line)
+    return list(dict.fromkeys(case_ids))
+
+
+# --- 2. CHECKPOINT ---
+class BatchCheckpoint:
+    """Append-only JSONL record of finished cases.
+
+    One line is appended (and flushed) per case as soon as it finishes, so
+    an interrupted run loses at most the cases that were in flight. When a
+    case appears more than once the last line wins; only "completed" cases
+    are skipped on resume, failed ones are retried.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.status = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from a crash
+                    self.status[record["case_id"]] = record["status"]
+
+    def completed(self, case_id: str) -> bool:
+        return self.status.get(case_id) == "completed"
+
+    def record(self, case_id: str, status: str, **fields):
+        line = json.dumps({"case_id": case_id, "status": status, "finished_at": time.time(), **fields})
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.status[case_id] = status
+
+
+# --- 3. RUNNER ---
+def missing_sections(document: str) -> List[str]:
+    return [name for name in CHARGESHEET_SECTIONS if section_header(name) not in document]
+
+
+def run_batch(rag_service, case_ids: List[str], output_dir: str = ".", max_workers: int = 2,
+              checkpoint: Optional[BatchCheckpoint] = None, incremental: bool = False,
+              mode: Optional[str] = None, generate: Callable = generate_case_chargesheet) -> dict:
+    """Generate chargesheets for `case_ids` on `max_workers` threads.
+
+    Each case's file is written by `generate` as soon as that case is done.
+    A case counts as failed if it raises or any section came back empty;
+    its partial document is still saved and it is retried on the next run.
+    LLM calls from all workers share the process-wide LLM_GLOBAL_CONCURRENCY
+    limit and rate limiter. Returns the summary that is also printed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    pending = [case_id for case_id in case_ids if not (checkpoint and checkpoint.completed(case_id))]
+    skipped = len(case_ids) - len(pending)
+    if skipped:
+        print(f"Resuming: {skipped} case(s) already completed, {len(pending)} to go.")
+
+    def run_one(case_id: str) -> dict:
+        start = time.perf_counter()
+        try:
+            document = generate(rag_service, case_id, output_dir, incremental=incremental, mode=mode)
+            missing = missing_sections(document)
+            error = f"sections failed: {', '.join(missing)}" if missing else None
+        except Exception as e:
+            error = str(e)
+        result = {"seconds": round(time.perf_counter() - start, 3)}
+        if error:
+            result["error"] = error
+        if checkpoint:
+            checkpoint.record(case_id, "failed" if error else "completed", **result)
+        return result
+
+    completed, failures = 0, {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="batch-case") as executor:
+        futures = {executor.submit(run_one, case_id): case_id for case_id in pending}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                case_id = futures[future]
+                result = future.result()
+                if "error" in result:
+                    failures[case_id] = result["error"]
+                    print(f"[{done}/{len(pending)}] {case_id} FAILED ({result['seconds']}s): {result['error']}")
+                else:
+                    completed += 1
+                    print(f"[{done}/{len(pending)}] {case_id} -> {output_path_for(case_id, output_dir)} ({result['seconds']}s)")
+        except KeyboardInterrupt:
+            print("\nInterrupted; waiting for in-flight cases. Re-run the same command to resume.")
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "cases": len(case_ids),
+        "skipped": skipped,
+        "completed": completed,
+        "failed": len(failures),
+        "elapsed_seconds": round(elapsed, 1),
+        "cases_per_hour": round(completed / elapsed * 3600, 1) if elapsed > 0 else 0.0,
+        "failures": failures,
+    }
+    print(f"\nBatch finished: {completed} completed, {len(failures)} failed, {skipped} skipped "
+          f"in {summary['elapsed_seconds']}s ({summary['cases_per_hour']} cases/hour).")
+    for case_id, error in failures.items():
+        print(f"  FAILED {case_id}: {error}")
+    return summary
@@ -0,0 +1,141 @@
+"""In-process stand-ins for the Chroma collection and the embedding model."""
+import hashlib
+import time
+
+import numpy as np
+
+from retrieval import matches_where
+
+
+class HashEmbedder:
+    """Deterministic bag-of-words hashing embedder with the SentenceTransformer
+    `encode` signature. No model download, microseconds per call."""
+
+    def __init__(self, dim: int = 384, delay: float = 0.0):
+        self.dim = dim
+        self.delay = delay
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            h = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:4], "little")
+            vector[h % self.dim] += 1.0 if h & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        return np.stack([self._embed(s) for s in sentences]) if sentences else np.zeros((0, self.dim), np.float32)
+
+
+class FakeCollection:
+    """Subset of the chromadb Collection API used by main.py, kept in memory.
+
+    `latency` simulates the network round-trip of Chroma Cloud per call.
+    """
+
+    def __init__(self, embedder=None, latency: float = 0.0, name: str = "investigation_docs"):
+        self.name = name
+        self.embedder = embedder or HashEmbedder()
+        self.latency = latency
+        self._ids = []
+        self._index = {}
+        self._embeddings = []
+        self._documents = []
+        self._metadatas = []
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        self._wait()
+        if embeddings is None:
+            embeddings = self.embedder.encode(list(documents))
+        for i, item_id in enumerate(ids):
+            row = (np.asarray(embeddings[i], dtype=np.float32),
+                   documents[i] if documents else None,
+                   metadatas[i] if metadatas else {})
+            if item_id in self._index:
+                pos = self._index[item_id]
+                self._embeddings[pos], self._documents[pos], self._metadatas[pos] = row
+            else:
+                self._index[item_id] = len(self._ids)
+                self._ids.append(item_id)
+                self._embeddings.append(row[0])
+                self._documents.append(row[1])
+                self._metadatas.append(row[2])
+
+    add = upsert
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        self._wait()
+        positions = [self._index[i] for i in ids if i in self._index] if ids is not None else range(len(self._ids))
+        positions = [p for p in positions if matches_where(self._metadatas[p], where)]
+        positions = positions[(offset or 0):]
+        if limit is not None:
+            positions = positions[:limit]
+        result = {"ids": [self._ids[p] for p in positions]}
+        for field, store in (("documents", self._documents), ("metadatas", self._metadatas),
+                             ("embeddings", self._embeddings)):
+            result[field] = [store[p] for p in positions] if field in include else None
+        return result
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None,
+              include=("documents", "metadatas", "distances")):
+        self._wait()
+        if query_embeddings is None:
+            query_embeddings = self.embedder.encode(list(query_texts))
+        candidates = [p for p in range(len(self._ids)) if matches_where(self._metadatas[p], where)]
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not candidates:
+            for _ in query_embeddings:
+                for field in result:
+                    result[field].append([])
+            return result
+
+        matrix = np.stack([self._embeddings[p] for p in candidates])
+        for query in np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1):
+            distances = 1.0 - matrix @ query
+            order = np.argsort(distances)[:n_results]
+            result["ids"].append([self._ids[candidates[o]] for o in order])
+            result["documents"].append([self._documents[candidates[o]] for o in order])
+            result["metadatas"].append([self._metadatas[candidates[o]] for o in order])
+            result["distances"].append([float(distances[o]) for o in order])
+        return result
+
+
+SAMPLE_CHUNKS = [
+    "FIR registered at {ps} Police Station under sections 363, 376 IPC and sec. 4 of POCSO Act on {date}.",
+    "Complainant {complainant} stated that her minor daughter was taken away from her lawful guardianship.",
+    "Accused {accused} was arrested at {place} and produced before the court.",
+    "Clothes of the accused were attached under arrest cum attachment panchanama and sent to FSL Verna.",
+    "Scene of offence panchanama was drawn in presence of panch witness {panch}.",
+    "Victim was medically examined by the Medical Officer at GMC Bambolim.",
+    "Statement of the victim was recorded under section 164 CrPC before the Magistrate.",
+    "Mobile phone used by the accused was seized and its call detail records were obtained.",
+]
+
+
+def seed_cases(collection, n_cases: int = 20, chunks_per_case: int = 8):
+    """Fill `collection` with synthetic case chunks. Returns the case ids."""
+    case_ids = []
+    for c in range(n_cases):
+        case_id = f"bench-case-{c:04d}"
+        case_ids.append(case_id)
+        fields = {"ps": f"PS{c % 7}", "date": f"{(c % 28) + 1:02d}.05.2024", "complainant": f"Complainant {c}",
+                  "accused": f"Accused {c}", "place": f"Village {c % 11}", "panch": f"Panch {c}"}
+        documents = [SAMPLE_CHUNKS[i % len(SAMPLE_CHUNKS)].format(**fields) + f" (case {case_id}, note {i})"
+                     for i in range(chunks_per_case)]
+        collection.upsert(
+            ids=[f"{case_id}-{i}" for i in range(chunks_per_case)],
+            documents=documents,
+            metadatas=[{"case_id": case_id, "chunk_index": i} for i in range(chunks_per_case)],
+        )
+    return case_ids
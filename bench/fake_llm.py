@@ -0,0 +1,115 @@
+"""Local stand-in for the OpenAI-compatible chat-completions endpoint.
+
+    python -m bench.fake_llm --port 9000 --latency 0.5 --tokens-per-sec 40
+
+Latency is the time to first token; completion tokens then arrive at
+`tokens_per_sec`. Both plain and `stream: true` requests are supported and
+responses carry a `usage` block like the real server.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMConfig:
+    def __init__(self, latency: float = 0.5, tokens_per_sec: float = 40.0,
+                 completion_tokens: int = 200, jitter: float = 0.1, error_rate: float = 0.0):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+
+def _approx_tokens(messages: list) -> int:
+    return sum(len(str(m.get("content", "")).split()) for m in messages)
+
+
+def make_handler(config: FakeLLMConfig):
+    class FakeLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if config.error_rate and random.random() < config.error_rate:
+                self._send_json(503, {"error": "injected failure"})
+                return
+
+            messages = body.get("messages", [])
+            n_tokens = min(int(body.get("max_tokens") or config.completion_tokens), config.completion_tokens)
+            prompt_tokens = _approx_tokens(messages)
+            time.sleep(max(0.0, config.latency * (1 + random.uniform(-config.jitter, config.jitter))))
+
+            if body.get("stream"):
+                self._stream(body, n_tokens)
+                return
+
+            time.sleep(n_tokens / config.tokens_per_sec)
+            self._send_json(200, {
+                "id": "fake-completion",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(["tok"] * n_tokens)}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                          "total_tokens": prompt_tokens + n_tokens},
+            })
+
+        def _send_json(self, status: int, payload: dict):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def _stream(self, body: dict, n_tokens: int):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for _ in range(n_tokens):
+                event = {"object": "chat.completion.chunk", "model": body.get("model"),
+                         "choices": [{"index": 0, "delta": {"content": "tok "}}]}
+                self._chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                time.sleep(1.0 / config.tokens_per_sec)
+            self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+
+    return FakeLLMHandler
+
+
+def start_fake_llm(config: FakeLLMConfig, host: str = "127.0.0.1", port: int = 0):
+    """Start the fake server in a daemon thread. Returns (server, chat-completions URL)."""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v1/chat/completions"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--jitter", type=float, default=0.1, help="+/- fraction applied to latency")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = FakeLLMConfig(args.latency, args.tokens_per_sec, args.completion_tokens, args.jitter, args.error_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Fake LLM listening on http://{args.host}:{args.port}/v1/chat/completions")
+    server.serve_forever()
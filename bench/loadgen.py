@@ -0,0 +1,189 @@
+"""Offline benchmark: fake LLM + in-process collection, no network.
+
+    python -m bench.loadgen --levels 1,4,16 --output bench/results/run.json
+
+Measures `generate_chargesheet` wall time per section-concurrency level and
+`/query/{case_id}` throughput and p50/p95/p99 latency per client
+concurrency level, and writes everything as JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.fake_llm import FakeLLMConfig, start_fake_llm
+from bench.fake_chroma import FakeCollection, HashEmbedder, seed_cases
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(latencies, wall: float, errors: int = 0) -> dict:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall, 4),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else 0.0,
+        "mean": round(statistics.fmean(latencies), 4) if latencies else 0.0,
+        "p50": round(percentile(latencies, 50), 4),
+        "p95": round(percentile(latencies, 95), 4),
+        "p99": round(percentile(latencies, 99), 4),
+    }
+
+
+def bench_generate(main, rag_service, case_ids, levels, repeats: int, artifacts=None) -> list:
+    """Wall time of generate_chargesheet at each section-concurrency level.
+
+    Section artifacts go to `artifacts` (a throwaway store) rather than
+    SECTION_ARTIFACTS_DIR."""
+    results = []
+    for level in levels:
+        latencies = []
+        for r in range(repeats):
+            case_id = case_ids[r % len(case_ids)]
+            context_text, section_contexts = main.retrieve_generation_contexts(rag_service, case_id)
+            start = time.perf_counter()
+            main.generate_chargesheet(context_text, case_id, max_workers=level, use_cache=False,
+                                      section_contexts=section_contexts, artifacts=artifacts)
+            latencies.append(time.perf_counter() - start)
+        results.append(dict(summarize(latencies, sum(latencies)), max_workers=level))
+    return results
+
+
+def start_api(app, port: int = 0):
+    import socket
+    import uvicorn
+
+    if not port:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="bench-api", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def bench_query(base_url: str, case_ids, levels, requests_per_level: int) -> list:
+    """Throughput and latency of POST /query/{case_id} at each client concurrency."""
+    import requests
+
+    local = threading.local()
+    questions = ["Who is the accused?", "What was seized?", "Which sections apply?", "Who are the witnesses?"]
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        case_id = case_ids[i % len(case_ids)]
+        start = time.perf_counter()
+        response = session.post(f"{base_url}/query/{case_id}", json={"query": questions[i % len(questions)]})
+        return time.perf_counter() - start, response.status_code == 200
+
+    results = []
+    for level in levels:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            outcomes = list(pool.map(one, range(requests_per_level)))
+        wall = time.perf_counter() - start
+        latencies = [latency for latency, ok in outcomes if ok]
+        results.append(dict(summarize(latencies, wall, errors=sum(1 for _, ok in outcomes if not ok)),
+                            concurrency=level))
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline chargesheet/query benchmark")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="comma-separated concurrency levels")
+    parser.add_argument("--section-levels", default="1,2,4", help="max_workers levels for generate_chargesheet")
+    parser.add_argument("--repeats", type=int, default=3, help="generate_chargesheet runs per level")
+    parser.add_argument("--requests", type=int, default=64, help="/query requests per level")
+    parser.add_argument("--cases", type=int, default=20)
+    parser.add_argument("--chunks-per-case", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--llm-completion-tokens", type=int, default=100)
+    parser.add_argument("--store", choices=["fake", "local"], default="fake",
+                        help="fake: in-memory Chroma stand-in; local: retrieval.LocalVectorIndex in a temp dir")
+    parser.add_argument("--store-latency", type=float, default=0.0, help="simulated vector-store round-trip (fake store)")
+    parser.add_argument("--embed-delay", type=float, default=0.0, help="simulated encode() cost")
+    parser.add_argument("--embed-cache", action="store_true",
+                        help="wrap the embedder in embedding.CachedEmbedder (in-memory cache + micro-batching)")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="keep the per-case semantic answer cache on (off by default: the query "
+                             "workload repeats questions, so it would measure cache hits)")
+    parser.add_argument("--skip-generate", action="store_true")
+    parser.add_argument("--skip-query", action="store_true")
+    parser.add_argument("--output", default=os.path.join("bench", "results", f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json"))
+    args = parser.parse_args()
+
+    llm_config = FakeLLMConfig(args.llm_latency, args.llm_tokens_per_sec, args.llm_completion_tokens)
+    _, llm_url = start_fake_llm(llm_config)
+
+    # main.py reads its configuration at import time, so point it at the fakes first.
+    os.environ["LLM_ENDPOINTS"] = f"bench|{llm_url}"
+    os.environ["COMPLETION_CACHE"] = "0"
+    os.environ["ANSWER_CACHE"] = "1" if args.answer_cache else "0"
+    os.environ.setdefault("LLM_RATE_PER_SEC", "1000")
+    os.environ.setdefault("LLM_RATE_BURST", "1000")
+    import main
+    from server import create_app
+    from retrieval import LocalVectorIndex
+    from case_index import CaseChunkIndex
+    from artifacts import SectionArtifactStore
+
+    embedder = HashEmbedder(delay=args.embed_delay)
+    if args.embed_cache:
+        from embedding import CachedEmbedder
+        embedder = CachedEmbedder(embedder, "bench-hash")
+    if args.store == "local":
+        collection = LocalVectorIndex(tempfile.mkdtemp(prefix="bench_index_"), embedder=embedder)
+    else:
+        collection = FakeCollection(embedder, latency=args.store_latency)
+    case_ids = seed_cases(collection, args.cases, args.chunks_per_case)
+    # In-memory case index: don't touch the real .cache/case_index.json
+    rag_service = main.RAGService(embedder=embedder, collection=collection, case_index=CaseChunkIndex())
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": vars(args),
+    }
+    if not args.skip_generate:
+        levels = [int(x) for x in args.section_levels.split(",") if x]
+        artifacts = SectionArtifactStore(tempfile.mkdtemp(prefix="bench_sections_"))
+        report["generate_chargesheet"] = bench_generate(main, rag_service, case_ids, levels, args.repeats, artifacts)
+    if not args.skip_query:
+        levels = [int(x) for x in args.levels.split(",") if x]
+        server, base_url = start_api(create_app(rag_service))
+        try:
+            report["query"] = bench_query(base_url, case_ids, levels, args.requests)
+        finally:
+            server.should_exit = True
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({k: report[k] for k in ("generate_chargesheet", "query") if k in report}, indent=2))
+    print(f"\nResults saved to '{args.output}'.")
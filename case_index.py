@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import threading
+from typing import List, Optional
+
+
+class CaseChunkIndex:
+    """Persistent case_id -> chunk-id map.
+
+    Once a case has been listed through a metadata-filtered scan, later
+    fetches go straight to `collection.get(ids=...)`. Each entry carries a
+    fingerprint of its id list so callers can tell when a case's document
+    set has changed.
+
+    Several processes may share the file (server, batch, ingest), so saving
+    only writes back the entries this process changed, on top of what is on
+    disk at that moment, and lookups re-read the file whenever another
+    process has saved it (e.g. ingest invalidating a case).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = self._stat()
+        self._cases = self._load()
+        self._changed = {}  # case_id -> new entry, or None if invalidated
+
+    def _stat(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns if self.path else None
+        except OSError:
+            return None
+
+    def _reload_if_changed(self):
+        # Callers hold the lock; _changed is always empty between saves.
+        mtime = self._stat()
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._cases = self._load()
+
+    def _load(self) -> dict:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: ignoring unreadable case index {self.path}: {e}")
+            return {}
+
+    @staticmethod
+    def fingerprint(ids: List[str]) -> str:
+        return hashlib.sha256("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
+
+    def get(self, case_id: str) -> Optional[List[str]]:
+        with self._lock:
+            self._reload_if_changed()
+            entry = self._cases.get(case_id)
+            return list(entry["ids"]) if entry else None
+
+    def version(self, case_id: str) -> Optional[str]:
+        with self._lock:
+            self._reload_if_changed()
+            entry = self._cases.get(case_id)
+            return entry["fingerprint"] if entry else None
+
+    def put(self, case_id: str, ids: List[str]) -> bool:
+        """Record the chunk ids of a case. Returns True if they differ from what was stored."""
+        fingerprint = self.fingerprint(ids)
+        with self._lock:
+            previous = self._cases.get(case_id)
+            changed = previous is None or previous["fingerprint"] != fingerprint
+            if changed:
+                self._cases[case_id] = self._changed[case_id] = {"ids": list(ids), "fingerprint": fingerprint}
+                self._save()
+        return changed
+
+    def invalidate(self, case_id: str):
+        with self._lock:
+            if self._cases.pop(case_id, None) is not None:
+                self._changed[case_id] = None
+                self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        cases = self._load()
+        for case_id, entry in self._changed.items():
+            if entry is None:
+                cases.pop(case_id, None)
+            else:
+                cases[case_id] = entry
+        self._changed = {}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cases, f)
+        os.replace(tmp_path, self.path)
+        self._cases = cases
+        self._mtime = self._stat()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import time
+
+from main import RAGService, generate_case_chargesheet
+
+
+def run(argv=None):
+    """`python cli.py [case_id] [--batch FILE] ...` (also reachable as `python main.py`)."""
+    started_at = time.perf_counter()
+    parser = argparse.ArgumentParser(description="Generate a chargesheet for a case")
+    parser.add_argument("case_id", nargs="?", default="68eaa843963b266f12d007af")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only regenerate sections whose inputs changed since the last run")
+    parser.add_argument("--mode", choices=["sections", "structured"],
+                        help="generation mode (default: GENERATION_MODE env, 'sections')")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="generate every case listed in FILE (one id per line, or JSONL with case_id) and exit")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "2")),
+                        help="cases generated concurrently in batch mode")
+    parser.add_argument("--output-dir", default=".", help="where chargesheets are written")
+    parser.add_argument("--checkpoint", help="batch checkpoint file (default: <output-dir>/batch_checkpoint.jsonl)")
+    args = parser.parse_args(argv)
+    case_id = args.case_id
+    
+    # Initialize RAG Service to access Chroma DB
+    print("Initializing RAG Service...")
+    try:
+        rag_service = RAGService()
+        rag_service.wait_ready()
+        print(f"RAG Service ready in {time.perf_counter() - started_at:.2f}s.")
+    except Exception as e:
+        print(f"ERROR initializing RAG Service: {e}")
+        print("Make sure CHROMA_API_KEY, CHROMA_TENANT, CHROMA_DATABASE are set in .env")
+        sys.exit(1)
+
+    if args.batch:
+        # Non-interactive: no server prompt, exit status reflects failures.
+        from batch import BatchCheckpoint, read_case_ids, run_batch
+        checkpoint = BatchCheckpoint(args.checkpoint or os.path.join(args.output_dir, "batch_checkpoint.jsonl"))
+        summary = run_batch(rag_service, read_case_ids(args.batch), args.output_dir, max_workers=args.workers,
+                            checkpoint=checkpoint, incremental=args.incremental, mode=args.mode)
+        sys.exit(1 if summary["failed"] else 0)
+
+    generate_case_chargesheet(rag_service, case_id, args.output_dir, incremental=args.incremental, mode=args.mode)
+    
+    # Ask if user wants to start the FastAPI server
+    start_server = input("\nDo you want to start the FastAPI server? (yes/no): ").strip().lower()
+    
+    if start_server in ['yes', 'y']:
+        print("Starting FastAPI server...")
+        # The server can also be started on its own: `python server.py` or `uvicorn server:app`
+        import uvicorn
+        from server import create_app
+        uvicorn.run(create_app(rag_service), host="0.0.0.0", port=8000)
+    else:
+        print("Exiting. FastAPI server not started.")
+
+
+if __name__ == "__main__":
+    run()
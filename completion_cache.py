@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+def completion_key(model_id: str, messages: list, temperature: float, max_tokens: int) -> str:
+    """Content address of a completion request."""
+    blob = json.dumps(
+        {"model": model_id, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """Persistent SQLite-backed cache of LLM completions.
+
+    Entries older than `max_age` seconds are treated as misses and purged;
+    once more than `max_entries` are stored the least recently used ones are
+    evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000, max_age: Optional[float] = 30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, model TEXT, content TEXT, "
+            "created_at REAL, accessed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions(accessed_at)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT content, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age is not None and now - row[1] > self.max_age):
+                if row is not None:
+                    self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    self._db.commit()
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, content: str, model_id: str = ""):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, model, content, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model_id, content, now, now)
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM completions")
+            self._db.commit()
+
+    def _evict(self, now: float):
+        if self.max_age is not None:
+            self._db.execute("DELETE FROM completions WHERE created_at < ?", (now - self.max_age,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
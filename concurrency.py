@@ -0,0 +1,74 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+
+# --- 1. RATE LIMITING ---
+class TokenBucket:
+    """Thread-safe token bucket used to pace outbound LLM calls.
+
+    `rate` tokens are added per second up to `capacity`, so a burst of
+    `capacity` calls can go out at once and the sustained rate never exceeds
+    `rate` calls per second.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = max(float(capacity), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take `tokens` if they are available right now."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available, then take them."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# --- 2. ORDERED FAN-OUT ---
+def run_ordered(func: Callable, items: Iterable, max_workers: int = 4,
+                rate_limiter: Optional[TokenBucket] = None) -> List:
+    """Run `func` over `items` on a bounded thread pool.
+
+    Results come back in the order of `items`, whatever order the calls
+    finish in. With `max_workers=1` this degrades to the old sequential loop.
+    Each call runs in a copy of the caller's context, so context variables
+    (e.g. the active metrics trace) carry over into the worker threads.
+    """
+    items = list(items)
+
+    def call(item):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        return func(item)
+
+    if max_workers <= 1 or len(items) <= 1:
+        return [call(item) for item in items]
+
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(lambda ctx, item: ctx.run(call, item), contexts, items))
@@ -0,0 +1,217 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from metrics import EMBEDDING_BATCH_SIZE, EMBEDDING_CACHE
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace-insensitive form of a query; this is what gets embedded and cached."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+# --- 1. TWO-LEVEL CACHE ---
+class EmbeddingCache:
+    """In-memory LRU in front of an optional SQLite store, keyed by (model, text)."""
+
+    def __init__(self, max_items: int = 10000, path: Optional[str] = None):
+        self.max_items = max_items
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self._db.commit()
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vector
+            missing = [key for key in keys if key not in found]
+            if self._db is not None and missing:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self._db is not None and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+                )
+                self._db.commit()
+
+
+# --- 2. MICRO-BATCHING ---
+class MicroBatcher:
+    """Groups single-text encode requests that arrive within `window` seconds
+    into one batched call to `encode_batch(list_of_texts) -> 2D array`."""
+
+    def __init__(self, encode_batch, window: float = 0.005, max_batch: int = 64):
+        self.encode_batch = encode_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._cond = threading.Condition()
+        threading.Thread(target=self._loop, name="embed-batcher", daemon=True).start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        with self._cond:
+            self._pending.append((text, future))
+            self._cond.notify()
+        return future
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # First request is here; give concurrent ones `window` to join.
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                EMBEDDING_BATCH_SIZE.observe(len(texts))
+                vectors = dict(zip(texts, self.encode_batch(texts)))
+                for text, future in batch:
+                    future.set_result(vectors[text])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+# --- 3. MODEL LOADING ---
+def load_sentence_transformer(model_name: str, backend: str = "torch", model_file: Optional[str] = None):
+    """SentenceTransformer on the given backend ("torch", "onnx", "openvino");
+    `model_file` selects an export such as a quantized ONNX file."""
+    from sentence_transformers import SentenceTransformer
+
+    kwargs = {}
+    if backend != "torch":
+        kwargs["backend"] = backend
+        if model_file:
+            kwargs["model_kwargs"] = {"file_name": model_file}
+    return SentenceTransformer(model_name, **kwargs)
+
+
+# --- 4. BACKGROUND LOADING ---
+class LazyModel:
+    """Stand-in for a model that is loaded on a background thread.
+
+    Loading starts immediately; `encode` waits for it to finish (and
+    re-raises its error). Callers that never miss the embedding cache don't
+    wait at all.
+    """
+
+    def __init__(self, load: Callable):
+        self._future = Future()
+        threading.Thread(target=self._load, args=(load,), name="embedding-model-loader", daemon=True).start()
+
+    def _load(self, load: Callable):
+        try:
+            self._future.set_result(load())
+        except BaseException as e:
+            self._future.set_exception(e)
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until loaded; returns the model."""
+        return self._future.result(timeout)
+
+    def encode(self, *args, **kwargs):
+        return self.wait().encode(*args, **kwargs)
+
+
+# --- 5. EMBEDDER FACADE ---
+class CachedEmbedder:
+    """Drop-in for SentenceTransformer.encode with caching and micro-batching.
+
+    `encode(str)` returns a 1-D array and `encode(list)` a 2-D array, like
+    SentenceTransformer. Single strings that miss the cache go through the
+    micro-batcher so concurrent requests share one forward pass; lists are
+    already batched and are encoded directly. Extra keyword arguments bypass
+    the cache and are passed to the model as-is.
+    """
+
+    def __init__(self, model, model_name: str, cache: Optional[EmbeddingCache] = None,
+                 batch_window: float = 0.005, max_batch: int = 64):
+        self.model = model
+        self.model_name = model_name
+        self.cache = cache or EmbeddingCache()
+        self.batcher = MicroBatcher(self._encode_batch, window=batch_window, max_batch=max_batch) if batch_window > 0 else None
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts), dtype=np.float32)
+
+    def encode(self, sentences, **kwargs):
+        if kwargs:
+            return self.model.encode(sentences, **kwargs)
+
+        single = isinstance(sentences, str)
+        texts = [normalize_text(sentences)] if single else [normalize_text(s) for s in sentences]
+        keys = [EmbeddingCache.key(self.model_name, text) for text in texts]
+
+        found = self.cache.get_many(keys)
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in found))
+        EMBEDDING_CACHE.inc(len(texts) - len(missing), result="hit")
+        EMBEDDING_CACHE.inc(len(missing), result="miss")
+
+        if missing:
+            if single and self.batcher is not None:
+                vectors = [self.batcher.submit(missing[0]).result()]
+            else:
+                EMBEDDING_BATCH_SIZE.observe(len(missing))
+                vectors = self._encode_batch(missing)
+            fresh = {EmbeddingCache.key(self.model_name, text): np.asarray(vector, dtype=np.float32)
+                     for text, vector in zip(missing, vectors)}
+            self.cache.put_many(fresh)
+            found.update(fresh)
+
+        if single:
+            return found[keys[0]]
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
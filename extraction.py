@@ -0,0 +1,178 @@
+import json
+import re
+from typing import Callable, Dict, List, Optional
+
+from pydantic import BaseModel, ValidationError
+
+
+# --- 1. SCHEMA ---
+class Accused(BaseModel):
+    name: str = ""
+    parent_or_spouse_name: str = ""
+    age: str = ""
+    address: str = ""
+    arrested_on: str = ""
+
+
+class FIRHeader(BaseModel):
+    district: str = ""
+    police_station: str = ""
+    year: str = ""
+    fir_no: str = ""
+    fir_date: str = ""
+    acts_and_sections: List[str] = []
+    complainant: str = ""
+    investigating_officer: str = ""
+    accused: List[Accused] = []
+
+
+class SeizedProperty(BaseModel):
+    description: str = ""
+    estimated_value: str = ""
+    property_register_no: str = ""
+    recovered_from: str = ""
+    disposal: str = ""
+
+
+class Witness(BaseModel):
+    name: str = ""
+    parent_or_spouse_name: str = ""
+    age: str = ""
+    occupation: str = ""
+    address: str = ""
+    evidence_type: str = ""
+
+
+class CaseFacts(BaseModel):
+    header: FIRHeader = FIRHeader()
+    properties: List[SeizedProperty] = []
+    witnesses: List[Witness] = []
+
+
+# --- 2. EXTRACTION PROMPT ---
+EXTRACTION_TEMPLATE = {
+    "header": {
+        "district": "", "police_station": "", "year": "", "fir_no": "", "fir_date": "",
+        "acts_and_sections": ["363 IPC"], "complainant": "", "investigating_officer": "",
+        "accused": [{"name": "", "parent_or_spouse_name": "", "age": "", "address": "", "arrested_on": ""}]
+    },
+    "properties": [
+        {"description": "", "estimated_value": "", "property_register_no": "", "recovered_from": "", "disposal": ""}
+    ],
+    "witnesses": [
+        {"name": "", "parent_or_spouse_name": "", "age": "", "occupation": "", "address": "", "evidence_type": ""}
+    ]
+}
+
+
+def build_extraction_messages(context_text: str) -> list:
+    """Chat messages for the single per-case extraction call."""
+    system_prompt = (
+        "You are a Legal Drafting Assistant for Indian Criminal Law. "
+        "Extract the facts needed for a Police Final Report (Chargesheet) from the case documents.\n"
+        "Reply with ONE JSON object and nothing else, using exactly this structure:\n"
+        f"{json.dumps(EXTRACTION_TEMPLATE, indent=2)}\n"
+        "Rules: copy names, numbers, dates and addresses as written in the documents; "
+        "use \"\" for anything not stated; list every seized article and every witness once; "
+        "evidence_type is the witness's role (Complainant, Victim, Panch witness, Medical Officer, ...)."
+    )
+    user_prompt = f"Case documents:\n\n{context_text}"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _stringify(value):
+    """Models often emit numbers (age, value) or null for text fields."""
+    if isinstance(value, dict):
+        return {key: _stringify(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_stringify(item) for item in value]
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return value
+
+
+def parse_case_facts(text: str) -> Optional[CaseFacts]:
+    """Validate the extraction reply. Returns None if it isn't usable JSON.
+
+    The first JSON object in the reply is used; prose around it is ignored."""
+    start = (text or "").find("{")
+    if start < 0:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, start)
+        if isinstance(data.get("header", {}).get("acts_and_sections"), str):
+            data["header"]["acts_and_sections"] = [data["header"]["acts_and_sections"]]
+        return CaseFacts(**_stringify(data))
+    except (ValueError, AttributeError, TypeError, ValidationError) as e:
+        print(f"WARNING: invalid extraction output: {e}")
+        return None
+
+
+# --- 3. DETERMINISTIC RENDERING ---
+def _age(value: str) -> str:
+    """Bare numbers get a " yrs" suffix; "Major", "38 yrs" etc. are printed as given."""
+    value = (value or "").strip()
+    return f"{value} yrs" if re.fullmatch(r"\d+(\.\d+)?", value) else value
+
+
+def _cell(value: str) -> str:
+    value = re.sub(r"\s+", " ", value or "").strip()
+    return value.replace("|", "/") or "-"
+
+
+def _table(headers: List[str], rows: List[List[str]]) -> str:
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    lines += ["| " + " | ".join(_cell(value) for value in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def render_initial_details(facts: CaseFacts) -> str:
+    header = facts.header
+    accused = "; ".join(
+        ", ".join(part for part in (a.name, a.parent_or_spouse_name and f"({a.parent_or_spouse_name})",
+                                    _age(a.age), a.address) if part)
+        for a in header.accused
+    )
+    rows = [
+        ["1.", "District", header.district],
+        ["2.", "Police Station", header.police_station],
+        ["3.", "Year", header.year],
+        ["4.", "FIR No.", header.fir_no],
+        ["5.", "Date of FIR", header.fir_date],
+        ["6.", "Acts & Sections", ", ".join(header.acts_and_sections)],
+        ["7.", "Type of Final Report", "Charge Sheet"],
+        ["8.", "Name of Complainant/Informant", header.complainant],
+        ["9.", "Name of Investigating Officer", header.investigating_officer],
+        ["10.", "Accused charge-sheeted", accused],
+        ["11.", "Date of arrest", "; ".join(f"{a.name}: {a.arrested_on}" for a in header.accused if a.arrested_on)],
+    ]
+    return "FINAL FORM/REPORT (Form 5.4)\n\n" + _table(["Sr. No.", "Particulars", "Details"], rows)
+
+
+def render_properties(facts: CaseFacts) -> str:
+    headers = ["Sl. No.", "Property Description", "Estimated Value (Rs.)", "P.S. Property Register No.",
+               "From whom/where recovered or seized", "Disposal"]
+    rows = [[f"{i}.", p.description, p.estimated_value, p.property_register_no, p.recovered_from, p.disposal]
+            for i, p in enumerate(facts.properties, 1)]
+    return _table(headers, rows or [["-", "Nil", "", "", "", ""]])
+
+
+def render_witnesses(facts: CaseFacts) -> str:
+    headers = ["Sr. No.", "Name", "Fathers/Husband Name", "Age", "Occupation", "Address", "Type of evidence"]
+    rows = [[f"{i}.", w.name, w.parent_or_spouse_name, _age(w.age), w.occupation, w.address,
+             w.evidence_type]
+            for i, w in enumerate(facts.witnesses, 1)]
+    return _table(headers, rows or [["-", "Nil", "", "", "", "", ""]])
+
+
+# Sections rendered from CaseFacts instead of being generated one by one.
+STRUCTURED_SECTIONS: Dict[str, Callable[[CaseFacts], str]] = {
+    "1_Initial_Details": render_initial_details,
+    "2_Properties_Seized": render_properties,
+    "3_Witnesses": render_witnesses,
+}
@@ -0,0 +1,324 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from prompt_builder import count_tokens
+
+# A document unit: (case_id, source, text, extra metadata such as the page number)
+Unit = Tuple[str, str, str, dict]
+
+
+# --- 1. READERS ---
+def read_pdf(path: str, case_id: str) -> Iterator[Unit]:
+    """One unit per page; pages are read lazily."""
+    from pypdf import PdfReader
+
+    source = os.path.basename(path)
+    for page_no, page in enumerate(PdfReader(path).pages, 1):
+        text = page.extract_text() or ""
+        if text.strip():
+            yield case_id, source, text, {"page": page_no}
+
+
+def read_docx(path: str, case_id: str) -> Iterator[Unit]:
+    """Paragraphs in document order, then every table row as ` | `-joined cells."""
+    import docx
+
+    source = os.path.basename(path)
+    document = docx.Document(path)
+    for paragraph in document.paragraphs:
+        if paragraph.text.strip():
+            yield case_id, source, paragraph.text, {}
+    for table in document.tables:
+        for row in table.rows:
+            cells = [cell.text.strip() for cell in row.cells]
+            if any(cells):
+                yield case_id, source, " | ".join(cells), {}
+
+
+def read_jsonl(path: str, case_id: Optional[str] = None) -> Iterator[Unit]:
+    """Lines like {"case_id": ..., "text": ..., "source": ..., "metadata": {...}}.
+    A line without case_id falls back to `case_id`."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record_case = record.get("case_id") or case_id
+            if not record_case:
+                raise ValueError(f"{path}:{line_no}: missing case_id")
+            text = record.get("text") or ""
+            if text.strip():
+                yield (str(record_case), record.get("source") or os.path.basename(path), text,
+                       dict(record.get("metadata") or {}))
+
+
+READERS: Dict[str, Callable[..., Iterator[Unit]]] = {
+    ".pdf": read_pdf,
+    ".docx": read_docx,
+    ".jsonl": read_jsonl,
+}
+
+
+def read_documents(paths: Iterable[str], case_id: Optional[str] = None) -> Iterator[Unit]:
+    """Units of every supported file under `paths` (files or directories).
+
+    PDF and DOCX files belong to `case_id`, or to the case named by the file
+    name (without extension) when no case_id is given.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            files = [path]
+        for file_path in files:
+            reader = READERS.get(os.path.splitext(file_path)[1].lower())
+            if reader is None:
+                continue
+            print(f"Reading {file_path}...")
+            file_case = case_id or os.path.splitext(os.path.basename(file_path))[0]
+            yield from reader(file_path, case_id if reader is read_jsonl else file_case)
+
+
+# --- 2. CHUNKING ---
+def _split_long(text: str, max_tokens: int) -> List[str]:
+    pieces, words, used = [], [], 0
+    for word in text.split():
+        words.append(word)
+        used += count_tokens(word)
+        if used >= max_tokens:
+            pieces.append(" ".join(words))
+            words, used = [], 0
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def _make_chunk(case_id: str, source: str, index: int, pieces: List[str], extra: dict,
+                case_id_field: str) -> Tuple[str, str, dict]:
+    text = "\n".join(pieces)
+    normalized = re.sub(r"\s+", " ", text).strip()
+    chunk_id = hashlib.sha256(f"{case_id}\0{normalized}".encode("utf-8")).hexdigest()[:32]
+    return chunk_id, text, {case_id_field: case_id, "source": source, "chunk_index": index, **extra}
+
+
+def chunk_units(units: Iterable[Unit], max_tokens: int = 300, case_id_field: str = "case_id") -> Iterator[Tuple[str, str, dict]]:
+    """Group consecutive units of the same case and source into chunks of up
+    to `max_tokens`. Yields (id, text, metadata); the id is a hash of the
+    case and the chunk text, so the same content always gets the same id.
+    A chunk carries the extra metadata (e.g. page) of its first unit.
+    chunk_index counts within each source, so a case's document order is
+    (source, chunk_index)."""
+    next_index: Dict[Tuple[str, str], int] = {}
+    key, pieces, extra, used = None, [], {}, 0
+
+    def flush():
+        nonlocal pieces, used
+        if pieces:
+            index = next_index.get(key, 0)
+            next_index[key] = index + 1
+            yield _make_chunk(key[0], key[1], index, pieces, extra, case_id_field)
+        pieces, used = [], 0
+
+    for case_id, source, text, unit_extra in units:
+        if (case_id, source) != key:
+            yield from flush()
+            key = (case_id, source)
+        for piece in _split_long(text, max_tokens) if count_tokens(text) > max_tokens else [text.strip()]:
+            cost = count_tokens(piece)
+            if pieces and used + cost > max_tokens:
+                yield from flush()
+            if not pieces:
+                extra = unit_extra
+            pieces.append(piece)
+            used += cost
+    yield from flush()
+
+
+# --- 3. EMBEDDING WORKERS ---
+_WORKER_MODEL = None
+
+
+def _init_worker(model_name: str, backend: str, model_file: Optional[str], threads: int):
+    global _WORKER_MODEL
+    try:
+        import torch
+        torch.set_num_threads(max(1, threads))
+    except ImportError:
+        pass
+    from embedding import load_sentence_transformer
+    _WORKER_MODEL = load_sentence_transformer(model_name, backend, model_file)
+
+
+def _encode_in_worker(texts: List[str], batch_size: int) -> np.ndarray:
+    return np.asarray(_WORKER_MODEL.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+class WorkerOnlyEmbedder:
+    """Embedder for the parent process when the workers do all the embedding,
+    so the model isn't loaded there as well."""
+
+    def encode(self, *args, **kwargs):
+        raise RuntimeError("embedding runs in the ingest worker processes")
+
+
+# --- 4. PIPELINE ---
+def _batches(chunks: Iterator[Tuple[str, str, dict]], size: int) -> Iterator[List[Tuple[str, str, dict]]]:
+    batch, seen = [], set()
+    for chunk in chunks:
+        if chunk[0] in seen:
+            continue
+        seen.add(chunk[0])
+        batch.append(chunk)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stale_chunk_ids(collection, case_id: str, source: str, keep: Set[str], case_id_field: str = "case_id",
+                    page_size: int = 500) -> List[str]:
+    """Ids stored for (case, source) that are not in `keep`."""
+    where = {"$and": [{case_id_field: case_id}, {"source": source}]}
+    ids = []
+    while True:
+        page = collection.get(where=where, limit=page_size, offset=len(ids), include=[])
+        ids.extend(page["ids"])
+        if len(page["ids"]) < page_size:
+            break
+    return [chunk_id for chunk_id in ids if chunk_id not in keep]
+
+
+def ingest(rag_service, units: Iterable[Unit], batch_size: int = 256, processes: int = 1,
+           max_tokens: int = 300, case_id_field: str = "case_id",
+           model_config: Optional[Tuple[str, str, Optional[str]]] = None, prune: bool = True) -> dict:
+    """Chunk, embed and upsert `units` into `rag_service.collection`.
+
+    Chunk ids are content hashes; ids already in the collection are skipped
+    before embedding, so re-ingesting unchanged files embeds and writes
+    nothing. With `prune=True`, once everything is stored, each ingested
+    file's chunks that this run did not produce (an edited file's old
+    version) are deleted, so a case never mixes two versions of a
+    document. With `processes > 1` batches are embedded in a process pool
+    (each worker loads `model_config` = (model, backend, file) once);
+    otherwise `rag_service.embedder` is used in-process. Every case that got
+    new or deleted chunks is invalidated on the service. Returns run stats.
+    """
+    collection = rag_service.collection
+    stats = {"chunks": 0, "skipped": 0, "embedded": 0, "deleted": 0, "cases": set()}
+    produced: Set[str] = set()
+    sources: Set[Tuple[str, str]] = set()
+    start = time.perf_counter()
+
+    pool = None
+    if processes > 1:
+        if model_config is None:
+            raise ValueError("model_config is required with processes > 1")
+        threads = max(1, (os.cpu_count() or processes) // processes)
+        # Spawned, not forked: a fork would copy the parent's threads (model
+        # loader, micro-batcher) and any torch state mid-flight.
+        pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                   initargs=(*model_config, threads),
+                                   mp_context=multiprocessing.get_context("spawn"))
+
+    def encode(texts: List[str]):
+        if pool is not None:
+            return pool.submit(_encode_in_worker, texts, 64)
+        return np.asarray(rag_service.embedder.encode(texts, batch_size=64), dtype=np.float32)
+
+    def store(batch, embeddings):
+        collection.upsert(
+            ids=[chunk_id for chunk_id, _, _ in batch],
+            embeddings=np.asarray(embeddings, dtype=np.float32).tolist(),
+            documents=[text for _, text, _ in batch],
+            metadatas=[metadata for _, _, metadata in batch]
+        )
+        stats["embedded"] += len(batch)
+        stats["cases"].update(metadata[case_id_field] for _, _, metadata in batch)
+        elapsed = time.perf_counter() - start
+        print(f"Upserted {stats['embedded']} chunks ({stats['embedded'] / elapsed:.1f} chunks/sec)...")
+
+    in_flight = {}
+    try:
+        for batch in _batches(chunk_units(units, max_tokens, case_id_field), batch_size):
+            stats["chunks"] += len(batch)
+            produced.update(chunk_id for chunk_id, _, _ in batch)
+            sources.update((metadata[case_id_field], metadata["source"]) for _, _, metadata in batch)
+            existing = set(collection.get(ids=[chunk_id for chunk_id, _, _ in batch], include=[])["ids"])
+            batch = [chunk for chunk in batch if chunk[0] not in existing]
+            stats["skipped"] += len(existing)
+            if not batch:
+                continue
+            if pool is None:
+                store(batch, encode([text for _, text, _ in batch]))
+                continue
+            in_flight[encode([text for _, text, _ in batch])] = batch
+            # Keep every worker busy, but don't read the whole input ahead.
+            if len(in_flight) >= 2 * processes:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    store(in_flight.pop(future), future.result())
+        for future in list(in_flight):
+            store(in_flight.pop(future), future.result())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    if prune:
+        for case_id, source in sorted(sources):
+            stale = stale_chunk_ids(collection, case_id, source, produced, case_id_field)
+            if stale:
+                collection.delete(ids=stale)
+                stats["deleted"] += len(stale)
+                stats["cases"].add(case_id)
+                print(f"Deleted {len(stale)} outdated chunk(s) of {source} ({case_id}).")
+
+    for case_id in stats["cases"]:
+        rag_service.invalidate_case(case_id)
+
+    elapsed = time.perf_counter() - start
+    stats["cases"] = sorted(stats["cases"])
+    stats["seconds"] = round(elapsed, 2)
+    stats["chunks_per_second"] = round(stats["embedded"] / elapsed, 1) if elapsed > 0 else 0.0
+    print(f"Ingested {stats['embedded']} new chunks ({stats['skipped']} unchanged, {stats['deleted']} deleted) for "
+          f"{len(stats['cases'])} case(s) in {stats['seconds']}s ({stats['chunks_per_second']} chunks/sec).")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load case documents (PDF, DOCX, JSONL) into the vector store")
+    parser.add_argument("paths", nargs="+", help="files or directories to ingest")
+    parser.add_argument("--case-id", help="case for PDF/DOCX files (default: file name without extension)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("INGEST_BATCH_SIZE", "256")),
+                        help="chunks per embedding batch and per upsert")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("INGEST_PROCESSES", "1")),
+                        help="embedding worker processes (1 = embed in this process)")
+    parser.add_argument("--chunk-tokens", type=int, default=int(os.getenv("INGEST_CHUNK_TOKENS", "300")))
+    parser.add_argument("--keep-stale", action="store_true",
+                        help="don't delete chunks of re-ingested files that are no longer in them")
+    args = parser.parse_args()
+
+    from main import (CASE_ID_FIELD, EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_MODEL_FILE,
+                      RAGService)
+
+    rag_service = RAGService(embedder=WorkerOnlyEmbedder() if args.processes > 1 else None)
+    ingest(
+        rag_service,
+        read_documents(args.paths, args.case_id),
+        batch_size=args.batch_size,
+        processes=args.processes,
+        max_tokens=args.chunk_tokens,
+        case_id_field=CASE_ID_FIELD,
+        model_config=(EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_MODEL_FILE),
+        prune=not args.keep_stale
+    )
@@ -0,0 +1,90 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class Job:
+    """One background chargesheet generation."""
+
+    def __init__(self, case_id: str, options: Optional[dict] = None):
+        self.id = uuid.uuid4().hex
+        self.case_id = case_id
+        self.options = options or {}
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "case_id": self.case_id,
+            "options": self.options,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Runs `runner(case_id, **options)` on a bounded worker pool and keeps job status.
+
+    Submitting a case that already has a queued or running job with the
+    same options returns that job instead of starting a duplicate. Only the last `max_finished`
+    finished jobs are kept.
+    """
+
+    def __init__(self, runner: Callable[..., str], max_workers: int = 2, max_finished: int = 200):
+        self.runner = runner
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chargesheet-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, case_id: str, **options) -> Job:
+        with self._lock:
+            for job in self._jobs.values():
+                if job.case_id == case_id and job.options == options and job.active:
+                    return job
+            job = Job(case_id, options)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = self.runner(job.case_id, **job.options)
+            job.status = "completed"
+        except Exception as e:
+            print(f"ERROR in job {job.id} for case {job.case_id}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            self._prune()
+
+    def _prune(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
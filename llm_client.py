@@ -0,0 +1,295 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class LLMError(Exception):
+    """Raised when no endpoint could produce a completion."""
+
+
+# HTTP statuses worth retrying on another attempt / endpoint.
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+# --- 1. ENDPOINT HEALTH ---
+class LLMEndpoint:
+    """One OpenAI-compatible chat-completions URL plus its latency/health stats.
+
+    `prior_latency` stands in for the latency of an endpoint that has not
+    completed a request yet, so its in-flight load still counts.
+    """
+
+    def __init__(self, url: str, model_id: str, pool_size: int = 8, window: int = 100,
+                 prior_latency: float = 1.0):
+        self.url = url
+        self.model_id = model_id
+        self.prior_latency = prior_latency
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.ewma_latency = None
+        self.in_flight = 0
+        self._started = deque()  # start times of in-flight requests, oldest first
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def __repr__(self):
+        return f"LLMEndpoint({self.model_id} @ {self.url})"
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def p95(self) -> Optional[float]:
+        """95th percentile of recent successful latencies, if we have enough samples."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 5:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def score(self) -> float:
+        """Lower is better: expected latency times queue depth times failures.
+
+        Expected latency is the EWMA (or `prior_latency` before the first
+        success), raised to the age of the oldest in-flight request, so a
+        replica that has stopped answering scores worse the longer it hangs.
+        """
+        with self._lock:
+            latency = self.ewma_latency if self.ewma_latency is not None else self.prior_latency
+            if self._started:
+                latency = max(latency, time.monotonic() - self._started[0])
+            return latency * (1 + self.in_flight) * (1 + self.consecutive_failures)
+
+    def record_start(self):
+        with self._lock:
+            self.in_flight += 1
+            self._started.append(time.monotonic())
+
+    def _finish(self):
+        # Callers hold the lock. Which request finished isn't tracked; dropping
+        # the oldest start keeps the "oldest in flight" age an upper bound.
+        self.in_flight -= 1
+        if self._started:
+            self._started.popleft()
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self._finish()
+            self._latencies.append(latency)
+            self.ewma_latency = latency if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * latency
+            self.consecutive_failures = 0
+            self.cooldown_until = 0.0
+
+    def record_cancel(self):
+        """The caller walked away mid-request; neither a success nor a failure."""
+        with self._lock:
+            self._finish()
+
+    def record_failure(self, cooldown: float):
+        with self._lock:
+            self._finish()
+            self.consecutive_failures += 1
+            # Back off an endpoint harder the more often it fails in a row.
+            self.cooldown_until = time.monotonic() + cooldown * min(2 ** (self.consecutive_failures - 1), 16)
+
+
+# --- 2. CLIENT ---
+class LLMClient:
+    """Pooled client over several LLM endpoints.
+
+    Every call goes to the healthy endpoint with the best latency score,
+    retries with exponential backoff (moving to the next endpoint each time),
+    and optionally hedges: if the first attempt is still running after the
+    endpoint's p95 latency, the same request is sent to a second endpoint and
+    whichever answers first wins.
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint], connect_timeout: float = 10.0,
+                 read_timeout: float = 300.0, max_retries: int = 2, backoff: float = 1.0,
+                 failure_cooldown: float = 15.0, hedge: bool = False,
+                 hedge_after: Optional[float] = None):
+        if not endpoints:
+            raise ValueError("at least one endpoint is required")
+        self.endpoints = endpoints
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.failure_cooldown = failure_cooldown
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self._hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge") if hedge else None
+
+    def ranked_endpoints(self, exclude=()) -> List[LLMEndpoint]:
+        """Healthy endpoints fastest first; cooling-down ones only as a last resort."""
+        candidates = [ep for ep in self.endpoints if ep not in exclude] or list(self.endpoints)
+        healthy = sorted((ep for ep in candidates if ep.healthy()), key=lambda ep: ep.score())
+        cooling = sorted((ep for ep in candidates if not ep.healthy()), key=lambda ep: ep.cooldown_until)
+        return healthy + cooling
+
+    def _post(self, endpoint: LLMEndpoint, payload: dict) -> dict:
+        """One HTTP attempt against one endpoint, with health bookkeeping."""
+        body = dict(payload, model=endpoint.model_id)
+        endpoint.record_start()
+        start = time.monotonic()
+        try:
+            response = endpoint.session.post(endpoint.url, json=body, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            # Fail fast on malformed bodies so they count against the endpoint.
+            data["choices"][0]["message"]["content"]
+        except Exception:
+            endpoint.record_failure(self.failure_cooldown)
+            raise
+        endpoint.record_success(time.monotonic() - start)
+        return data
+
+    def _hedged_post(self, payload: dict, primary: LLMEndpoint) -> dict:
+        """Send to `primary`; after its p95 deadline also race a second endpoint."""
+        deadline = primary.p95() or self.hedge_after
+        first = self._hedge_pool.submit(self._post, primary, payload)
+        if deadline is None:
+            return first.result()
+
+        done, _ = wait([first], timeout=deadline)
+        if done:
+            return first.result()
+
+        # A single-URL pool still benefits: the hedge usually lands on another replica.
+        backup = (self.ranked_endpoints(exclude=(primary,)) or [primary])[0]
+        print(f"LLM: {primary.url} slower than {deadline:.1f}s, hedging to {backup.url}")
+        pending = {first, self._hedge_pool.submit(self._post, backup, payload)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _should_retry(self, error: Exception) -> bool:
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code in RETRYABLE_STATUS
+        return isinstance(error, (requests.ConnectionError, requests.Timeout, ValueError, KeyError, IndexError))
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    def chat(self, messages: list, **params) -> dict:
+        """Return the raw chat-completions JSON response."""
+        payload = dict(params, messages=messages)
+        tried = []
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            endpoint = self.ranked_endpoints(exclude=tried)[0]
+            tried.append(endpoint)
+            try:
+                if self.hedge:
+                    return self._hedged_post(payload, endpoint)
+                return self._post(endpoint, payload)
+            except Exception as e:
+                last_error = e
+                if not self._should_retry(e) or attempt == self.max_retries:
+                    break
+                delay = self._backoff_delay(attempt)
+                print(f"LLM: attempt {attempt + 1} on {endpoint.url} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+        raise LLMError(f"LLM request failed after {attempt + 1} attempt(s): {last_error}") from last_error
+
+    def complete(self, messages: list, **params) -> str:
+        """Return just the assistant message content."""
+        return self.chat(messages, **params)["choices"][0]["message"]["content"]
+
+    def stream(self, messages: list, **params) -> Iterator[str]:
+        """Yield content deltas from a `stream: true` request.
+
+        Retries and failover only happen before the first delta; once text has
+        been handed to the caller a failure is raised as LLMError. Streams are
+        never hedged.
+        """
+        payload = dict(params, messages=messages, stream=True)
+        tried = []
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            endpoint = self.ranked_endpoints(exclude=tried)[0]
+            tried.append(endpoint)
+            body = dict(payload, model=endpoint.model_id)
+            started = False
+            finished = False
+            error = None
+
+            endpoint.record_start()
+            start = time.monotonic()
+            try:
+                with endpoint.session.post(endpoint.url, json=body, timeout=self.timeout, stream=True) as response:
+                    response.raise_for_status()
+                    for delta in iter_sse_deltas(response):
+                        started = True
+                        yield delta
+                finished = True
+            except Exception as e:
+                error = e
+            finally:
+                if finished:
+                    endpoint.record_success(time.monotonic() - start)
+                elif error is not None:
+                    endpoint.record_failure(self.failure_cooldown)
+                else:
+                    endpoint.record_cancel()
+
+            if finished:
+                return
+            last_error = error
+            if started or not self._should_retry(error) or attempt == self.max_retries:
+                break
+            delay = self._backoff_delay(attempt)
+            print(f"LLM: stream attempt {attempt + 1} on {endpoint.url} failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+        raise LLMError(f"LLM stream failed after {attempt + 1} attempt(s): {last_error}") from last_error
+
+
+def iter_sse_deltas(response) -> Iterator[str]:
+    """Pull content deltas out of an OpenAI-compatible SSE response body."""
+    done = False
+    # chunk_size=None hands over data as it arrives instead of filling 512-byte reads.
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if done or not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            # Read the body to its end so the connection goes back to the pool
+            # instead of being closed mid-response.
+            done = True
+            continue
+        choices = json.loads(data).get("choices") or []
+        if choices:
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+
+def parse_endpoints(spec: str, default_model: str) -> List[LLMEndpoint]:
+    """Parse "model|url,model|url" (model optional) into endpoints."""
+    endpoints = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        model_id, _, url = entry.rpartition("|")
+        endpoints.append(LLMEndpoint(url.strip(), model_id.strip() or default_model))
+    return endpoints
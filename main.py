@@ -1,28 +1,68 @@
 import os
-import requests
 import json
 import time
-from typing import Optional
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import uvicorn
-import chromadb
-from sentence_transformers import SentenceTransformer
+import queue
+import threading
+import contextvars
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Tuple
+# chromadb and sentence_transformers are slow to import; they are loaded
+# where they are used (connect_chroma_collection, load_embedding_model).
 from dotenv import load_dotenv
+from concurrency import TokenBucket, run_ordered
+from llm_client import LLMClient, parse_endpoints
+from completion_cache import CompletionCache, completion_key
+from metrics import LLM_REQUESTS, PROMPT_TOKENS, QUERY_ANSWERS, span, trace_case, record_llm_usage
+from retrieval import LocalVectorIndex
+from case_index import CaseChunkIndex
+from artifacts import SectionArtifactStore
+from prompt_builder import PromptBuilder, join_chunks
+from extraction import STRUCTURED_SECTIONS, CaseFacts, build_extraction_messages, parse_case_facts
+from embedding import CachedEmbedder, EmbeddingCache, LazyModel, load_sentence_transformer, normalize_text
+from query_cache import SingleFlight, SemanticAnswerCache
 
 load_dotenv()
 
-# --- Pydantic Model ---
-class QueryRequest(BaseModel):
-    query: str
-
-class QueryResponse(BaseModel):
-    answer: str
-    retrieved_count: int
-
 # --- CONFIGURATION ---
 LLM_API_URL = "https://gemma-27b.greenrock-7c76d2df.centralindia.azurecontainerapps.io/v1/chat/completions"
 MODEL_ID = "gemma2:27b"
+LLM_MAX_TOKENS = 3000
+LLM_TEMPERATURE = 0.1  # Low temperature for factual consistency
+
+# Comma-separated "model|url" entries, e.g. to add the llama replica from prompt.py:
+# LLM_ENDPOINTS="gemma2:27b|https://gemma-27b.../v1/chat/completions,llama3.2-vision:11b|https://llama-3b.../v1/chat/completions"
+LLM_CLIENT = LLMClient(
+    parse_endpoints(os.getenv("LLM_ENDPOINTS", LLM_API_URL), MODEL_ID),
+    read_timeout=float(os.getenv("LLM_TIMEOUT", "300")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+    hedge=os.getenv("LLM_HEDGE", "0") == "1",
+    hedge_after=float(os.getenv("LLM_HEDGE_AFTER")) if os.getenv("LLM_HEDGE_AFTER") else None
+)
+# Any call may be routed or hedged to any endpoint, so cached completions and
+# section artifacts are keyed by every model the pool can serve, not MODEL_ID.
+POOL_MODEL_ID = "+".join(sorted({endpoint.model_id for endpoint in LLM_CLIENT.endpoints}))
+
+# Repeat generations for the same prompts are served from disk. Set
+# COMPLETION_CACHE=0 to turn it off entirely.
+COMPLETION_CACHE = CompletionCache(
+    os.getenv("COMPLETION_CACHE_PATH", os.path.join(".cache", "completions.sqlite3")),
+    max_entries=int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "5000")),
+    max_age=float(os.getenv("COMPLETION_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600
+) if os.getenv("COMPLETION_CACHE", "1") == "1" else None
+
+# Sections are independent, so they are generated in parallel. The token
+# bucket replaces the old fixed 1s "polite delay" between calls.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_RATE_LIMITER = TokenBucket(
+    rate=float(os.getenv("LLM_RATE_PER_SEC", "1")),
+    capacity=float(os.getenv("LLM_RATE_BURST", "4"))
+)
+# Cap on chargesheet-generation LLM requests in flight across the whole process,
+# however many cases (batch workers, API jobs) are generating at once. /query
+# answers don't take a slot, so officers' questions never queue behind them.
+LLM_GLOBAL_CONCURRENCY = int(os.getenv("LLM_GLOBAL_CONCURRENCY", str(LLM_MAX_CONCURRENCY)))
+GENERATION_INFLIGHT = threading.BoundedSemaphore(LLM_GLOBAL_CONCURRENCY)
 
 # --- 1. REAL-WORLD EXAMPLES (Extracted from your PDF) ---
 # We organize examples by SECTION so the model focuses only on what matters for that specific part.
@@ -76,41 +116,117 @@ EXAMPLES_WITNESSES = [
 CHARGESHEET_SECTIONS = {
     "1_Initial_Details": {
         "instruction": "Generate the 'Final Form/Report' header table (Form 5.4). Include District, PS, FIR No, Date, and Sections. Use standard format.",
-        "examples": "" # Format is standard, fewer examples needed for header usually
+        "examples": "", # Format is standard, fewer examples needed for header usually
+        # Retrieval queries used to pick this section's context out of the case
+        "queries": [
+            "FIR number police station district date of registration",
+            "sections of law IPC POCSO offence registered",
+            "accused name age address arrested",
+        ]
     },
     "2_Properties_Seized": {
         "instruction": "Generate the table for 'Details of properties/Articles/Documents recovered/Seized'. Use the exact table headers: Sl. No., Property Description, Estimated Value, P.S. Property Register No., From whom/where recovered, Disposal.",
-        "examples": EXAMPLES_PROPERTIES
+        "examples": EXAMPLES_PROPERTIES,
+        "queries": [
+            "property seized attached under panchanama",
+            "articles recovered sealed envelope sent to FSL for examination",
+            "seizure memo mobile phone clothes documents recovered from accused",
+        ]
     },
     "3_Witnesses": {
         "instruction": "Generate the table for 'Particulars of witnesses to be examined'. Columns: Sr. No., Name, Father's/Husband's Name, Age, Occupation, Address, Type of evidence.",
-        "examples": EXAMPLES_WITNESSES
+        "examples": EXAMPLES_WITNESSES,
+        "queries": [
+            "statement of witness recorded complainant victim",
+            "panch witness name father's name age occupation address",
+            "medical officer doctor examination report",
+        ]
     },
     "4_Brief_Facts": {
         "instruction": "Generate 'Brief Facts of the case'. Start strictly with 'MAY IT PLEASE YOUR HONOUR'. Narrate the incident chronologically. End with 'Hence the charge.' or 'HENCE THE CHARGE'.",
-        "examples": EXAMPLES_BRIEF_FACTS
+        "examples": EXAMPLES_BRIEF_FACTS,
+        "queries": [
+            "incident narrative date time place of offence",
+            "complaint lodged by complainant what happened",
+            "investigation arrest of accused chronology of events",
+        ]
     }
 }
 
 
 #Helper functions
 # --- 3. HELPER FUNCTIONS ---
-def askGemini(messages):
-    """Call the LLM API."""
+def askGemini(messages, use_cache: bool = True, refresh: bool = False,
+              inflight: Optional[threading.Semaphore] = None):
+    """Call the LLM API.
+
+    `use_cache=False` bypasses the completion cache for this call;
+    `refresh=True` skips the lookup and overwrites the cached entry.
+    The request holds a slot of `inflight` (e.g. GENERATION_INFLIGHT), if given.
+    """
+    max_tokens = LLM_MAX_TOKENS
+    temperature = LLM_TEMPERATURE
+    cache = COMPLETION_CACHE if use_cache else None
+    key = completion_key(POOL_MODEL_ID, messages, temperature, max_tokens) if cache else None
+
+    if cache and not refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            LLM_REQUESTS.inc(status="cache_hit")
+            return cached
+
     try:
-        payload = {
-            "model": MODEL_ID,
-            "messages": messages,
-            "max_tokens": 3000,
-            "temperature": 0.1  # Low temperature for factual consistency
-        }
-        response = requests.post(LLM_API_URL, json=payload, timeout=None)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        with inflight or nullcontext(), span("llm") as record:
+            start = time.perf_counter()
+            response = LLM_CLIENT.chat(messages, max_tokens=max_tokens, temperature=temperature)
+            record_llm_usage(record, response, time.perf_counter() - start)
+        content = response["choices"][0]["message"]["content"]
+        LLM_REQUESTS.inc(status="ok")
     except Exception as e:
+        LLM_REQUESTS.inc(status="error")
         print(f"ERROR: {e}")
         return ""
 
+    if cache and content:
+        cache.put(key, content, POOL_MODEL_ID)
+    return content
+
+def askGeminiStream(messages, use_cache: bool = True,
+                    inflight: Optional[threading.Semaphore] = None) -> Iterator[str]:
+    """Stream the LLM answer as content deltas.
+
+    A cache hit is yielded as a single chunk. Unlike askGemini, errors are
+    raised so callers can tell a failed section from an empty one.
+    """
+    max_tokens = LLM_MAX_TOKENS
+    temperature = LLM_TEMPERATURE
+    cache = COMPLETION_CACHE if use_cache else None
+    key = completion_key(POOL_MODEL_ID, messages, temperature, max_tokens) if cache else None
+
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            LLM_REQUESTS.inc(status="cache_hit")
+            yield cached
+            return
+
+    parts = []
+    with inflight or nullcontext(), span("llm", stream=True) as record:
+        start = time.perf_counter()
+        try:
+            for delta in LLM_CLIENT.stream(messages, max_tokens=max_tokens, temperature=temperature):
+                if not parts:
+                    record["first_token_seconds"] = round(time.perf_counter() - start, 6)
+                parts.append(delta)
+                yield delta
+        except Exception:
+            LLM_REQUESTS.inc(status="error")
+            raise
+    LLM_REQUESTS.inc(status="ok")
+
+    if cache and parts:
+        cache.put(key, "".join(parts), POOL_MODEL_ID)
+
 def format_few_shot(examples):
     """Converts the list of dicts into a string for the prompt."""
     if not examples: return ""
@@ -119,72 +235,271 @@ def format_few_shot(examples):
         text += f"\n[EXAMPLE INPUT]:\n{ex['input']}\n[EXAMPLE OUTPUT]:\n{ex['output']}\n"
     return text
 
+def chunk_position(metadata: Optional[dict]) -> tuple:
+    """Document order of a chunk: chunk_index counts within its source file."""
+    metadata = metadata or {}
+    return str(metadata.get("source", "")), metadata.get("chunk_index", 0)
+
 # --- RAG Logic ---
-class RAGService:
-    def __init__(self):
-        # 1. Setup Embedding
-        print("Loading embedding model...")
-        self.embedder = SentenceTransformer('all-MiniLM-L6-v2')
-
-        # 2. Connect to Chroma Cloud
-        print("Connecting to Chroma Cloud...")
-        self.client = chromadb.CloudClient(
-            api_key=os.getenv("CHROMA_API_KEY"),
-            tenant=os.getenv("CHROMA_TENANT"),
-            database=os.getenv("CHROMA_DATABASE")
-        )
-        self.collection = self.client.get_collection(
-            name=os.getenv("CHROMA_COLLECTION", "investigation_docs")
-        )
+# "chroma" (Chroma Cloud, default) or "local" (embedded LocalVectorIndex at LOCAL_INDEX_DIR,
+# which can be filled from Chroma with `python retrieval.py sync`).
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(".cache", "local_index"))
+# Chunks are tied to their case through this metadata field.
+CASE_ID_FIELD = os.getenv("CASE_ID_FIELD", "case_id")
+CASE_INDEX_PATH = os.getenv("CASE_INDEX_PATH", os.path.join(".cache", "case_index.json"))
+CASE_PAGE_SIZE = int(os.getenv("CASE_PAGE_SIZE", "200"))
+# Section-targeted retrieval and hits per query.
+SECTION_RETRIEVAL = os.getenv("SECTION_RETRIEVAL", "1") == "1"
+SECTION_TOP_K = int(os.getenv("SECTION_TOP_K", "8"))
+# Context budget per section prompt, for retrieval and prompt building alike (a
+# section's "context_tokens" overrides it), and the shingle similarity above which
+# retrieved chunks count as duplicates.
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "4000"))
+PROMPT_DEDUPE_THRESHOLD = float(os.getenv("PROMPT_DEDUPE_THRESHOLD", "0.8"))
+# Query embeddings: LRU + on-disk cache, and micro-batching of concurrent encodes.
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# "torch" (default), or "onnx"/"openvino" for faster CPU inference; EMBEDDING_MODEL_FILE
+# picks a specific export, e.g. "onnx/model_qint8_avx512_vnni.onnx" for the quantized one.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_MODEL_FILE = os.getenv("EMBEDDING_MODEL_FILE")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+# /query answers: reuse a cached answer for a near-identical question about the same case.
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_PER_CASE = int(os.getenv("ANSWER_CACHE_MAX_PER_CASE", "256"))
+ANSWER_CACHE_MAX_AGE = float(os.getenv("ANSWER_CACHE_MAX_AGE", str(24 * 3600)))
+# "sections": every section is generated by its own prompt. "structured": one
+# extraction call per case fills CaseFacts, the table sections are rendered
+# from it and only the narrative sections are generated.
+GENERATION_MODE = os.getenv("GENERATION_MODE", "sections")
+# Every generated section is kept here with the hash of its prompt, for incremental reruns.
+# Unlike COMPLETION_CACHE (LRU/age-evicted, optional, LLM replies only) this is the
+# per-case record of what went into the last document, including rendered tables.
+SECTION_ARTIFACTS = SectionArtifactStore(os.getenv("SECTION_ARTIFACTS_DIR", os.path.join(".cache", "sections")))
 
-    def process_query(self, query: str, case_id: str) -> str:
-        """Process a query and return relevant information."""
-        try:
-            # Query the collection
-            results = self.collection.query(
-                query_embeddings=[self.embedder.encode(query).tolist()],
-                n_results=5
+
+def connect_chroma_collection():
+    """Open the investigation_docs collection on Chroma Cloud."""
+    missing = [key for key in ("CHROMA_API_KEY", "CHROMA_TENANT", "CHROMA_DATABASE") if not os.getenv(key)]
+    if missing:
+        raise ValueError(f"Missing Chroma settings: {', '.join(missing)}")
+    import chromadb
+
+    print("Connecting to Chroma Cloud...")
+    client = chromadb.CloudClient(
+        api_key=os.getenv("CHROMA_API_KEY"),
+        tenant=os.getenv("CHROMA_TENANT"),
+        database=os.getenv("CHROMA_DATABASE")
+    )
+    return client.get_collection(
+        name=os.getenv("CHROMA_COLLECTION", "investigation_docs")
+    )
+
+
+def embedding_model_name() -> str:
+    """EMBEDDING_MODEL plus its backend/export, so cached vectors from different exports never mix."""
+    if EMBEDDING_BACKEND == "torch":
+        return EMBEDDING_MODEL
+    return "|".join(part for part in (EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_MODEL_FILE) if part)
+
+
+def load_embedding_model():
+    """Load the SentenceTransformer for EMBEDDING_MODEL on EMBEDDING_BACKEND."""
+    start = time.perf_counter()
+    model = load_sentence_transformer(EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_MODEL_FILE)
+    print(f"Embedding model {embedding_model_name()} loaded in {time.perf_counter() - start:.2f}s.")
+    return model
+
+
+class RAGService:
+    def __init__(self, embedder=None, collection=None, backend: Optional[str] = None,
+                 case_index: Optional[CaseChunkIndex] = None):
+        """`collection` is any RetrievalBackend (a Chroma collection, a
+        LocalVectorIndex, the bench/ fake). If not given it is built from
+        `backend` (default RETRIEVAL_BACKEND)."""
+        # 1. Setup Embedding; the model loads in the background while the backend connects
+        if embedder is None:
+            print("Loading embedding model...")
+            embedder = CachedEmbedder(
+                LazyModel(load_embedding_model),
+                embedding_model_name(),
+                cache=EmbeddingCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH),
+                batch_window=EMBED_BATCH_WINDOW_MS / 1000.0,
+                max_batch=EMBED_MAX_BATCH
             )
-            
-            # Format retrieved context
-            context_lines = results.get("documents", [[]])[0]
-            context = "\n".join(context_lines)
-
-            # Use the provided LLM endpoint for RAG answering
-            system_prompt = (
-                "You are a legal RAG assistant. Answer strictly using the provided context. "
-                "If the context is insufficient, say you do not have enough information."
+        self.embedder = embedder
+
+        # 2. Connect the retrieval backend
+        if collection is None:
+            backend = backend or RETRIEVAL_BACKEND
+            if backend == "local":
+                print(f"Opening local vector index at {LOCAL_INDEX_DIR}...")
+                collection = LocalVectorIndex(LOCAL_INDEX_DIR, embedder=self.embedder, partition_by=CASE_ID_FIELD)
+            elif backend == "chroma":
+                collection = connect_chroma_collection()
+            else:
+                raise ValueError(f"Unknown RETRIEVAL_BACKEND: {backend}")
+        self.collection = collection
+
+        # 3. case_id -> chunk ids, so whole-case fetches are direct lookups
+        self.case_index = case_index if case_index is not None else CaseChunkIndex(CASE_INDEX_PATH)
+
+        # 4. Repeat questions: coalesce identical in-flight ones, reuse near-identical answers
+        self.single_flight = SingleFlight()
+        self.answer_cache = SemanticAnswerCache(
+            ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_PER_CASE, ANSWER_CACHE_MAX_AGE
+        ) if ANSWER_CACHE else None
+
+    def wait_ready(self, timeout: Optional[float] = None):
+        """Block until the embedding model is loaded; raises if loading failed."""
+        model = getattr(self.embedder, "model", None)
+        if isinstance(model, LazyModel):
+            model.wait(timeout)
+
+    def invalidate_case(self, case_id: str):
+        """Forget everything derived from a case's documents (call after they change)."""
+        self.case_index.invalidate(case_id)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(case_id)
+
+    def _scan_case(self, case_id: str, include: list) -> dict:
+        """Page through every chunk whose metadata matches `case_id` and record
+        the ids in the case index. A changed id list drops the case's cached answers."""
+        out = {"ids": [], "documents": [], "metadatas": []}
+        while True:
+            page = self.collection.get(
+                where={CASE_ID_FIELD: case_id},
+                limit=CASE_PAGE_SIZE,
+                offset=len(out["ids"]),
+                include=include
             )
-            user_prompt = f"Context:\n{context}\n\nQuestion: {query}"
+            out["ids"].extend(page["ids"])
+            out["documents"].extend(page.get("documents") or [])
+            out["metadatas"].extend(page.get("metadatas") or [])
+            if len(page["ids"]) < CASE_PAGE_SIZE:
+                break
+        if self.case_index.put(case_id, out["ids"]) and self.answer_cache is not None:
+            self.answer_cache.invalidate(case_id)
+        return out
+
+    def case_chunk_ids(self, case_id: str, refresh: bool = False) -> list:
+        """Chunk ids of a case.
+
+        Indexed ids are trusted until the case is invalidated (by this or
+        another process, e.g. ingest) or `refresh=True`; only then are they
+        listed from the collection again.
+        """
+        ids = None if refresh else self.case_index.get(case_id)
+        if ids is None:
+            ids = self._scan_case(case_id, include=[])["ids"]
+        return ids
 
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ]
+    def _get_by_ids(self, ids: list) -> dict:
+        out = {"ids": [], "documents": [], "metadatas": []}
+        for start in range(0, len(ids), CASE_PAGE_SIZE):
+            page = self.collection.get(ids=ids[start:start + CASE_PAGE_SIZE], include=["documents", "metadatas"])
+            out["ids"].extend(page["ids"])
+            out["documents"].extend(page["documents"] or [])
+            out["metadatas"].extend(page["metadatas"] or [])
+        return out
 
-            return askGemini(messages)
+    def fetch_case_chunks(self, case_id: str, refresh: bool = False) -> dict:
+        """All chunks of a case as {"ids", "documents", "metadatas"}, in chunk order.
+
+        With the case's ids indexed this is a direct lookup by id. Otherwise
+        (or with `refresh=True`, or when indexed ids have disappeared from
+        the collection) the chunks are paged by the metadata filter, which
+        also indexes their ids.
+        """
+        ids = None if refresh else self.case_index.get(case_id)
+        chunks = self._get_by_ids(ids) if ids is not None else None
+        if chunks is None or len(chunks["ids"]) != len(ids):
+            chunks = self._scan_case(case_id, include=["documents", "metadatas"])
+
+        # Chroma returns records in storage order; restore the document order.
+        order = sorted(range(len(chunks["ids"])), key=lambda i: chunk_position(chunks["metadatas"][i]))
+        return {field: [values[i] for i in order] for field, values in chunks.items()}
+
+    def process_query(self, query: str, case_id: str) -> str:
+        """Process a query and return relevant information.
+
+        Identical questions about the same case that arrive while one is
+        being answered share that answer instead of calling the LLM again.
+        """
+        try:
+            answer, shared = self.single_flight.do((case_id, normalize_text(query)),
+                                                   lambda: self._answer_query(query, case_id))
+            if shared:
+                QUERY_ANSWERS.inc(source="coalesced")
+            return answer
         except Exception as e:
             print(f"ERROR in process_query: {e}")
             return ""
 
+    def _answer_query(self, query: str, case_id: str) -> str:
+        """Embed -> semantic answer cache -> case-scoped retrieval -> LLM."""
+        with span("embed"):
+            query_embedding = self.embedder.encode(query).tolist()
+
+        version = None
+        if self.answer_cache is not None:
+            # Version = fingerprint of the case's indexed chunk ids, so answers cached
+            # before documents were added or removed (and the case invalidated, by
+            # this process or by ingest) stop matching.
+            version = CaseChunkIndex.fingerprint(self.case_chunk_ids(case_id))
+            cached = self.answer_cache.lookup(case_id, query_embedding, version)
+            if cached is not None:
+                QUERY_ANSWERS.inc(source="semantic_cache")
+                return cached
+
+        # Query the collection, restricted to this case's chunks
+        with span("retrieval", case_id=case_id):
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=5,
+                where={CASE_ID_FIELD: case_id}
+            )
+        
+        # Format retrieved context
+        context_lines = results.get("documents", [[]])[0]
+        context = "\n".join(context_lines)
+
+        # Use the provided LLM endpoint for RAG answering
+        system_prompt = (
+            "You are a legal RAG assistant. Answer strictly using the provided context. "
+            "If the context is insufficient, say you do not have enough information."
+        )
+        user_prompt = f"Context:\n{context}\n\nQuestion: {query}"
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+        answer = askGemini(messages)
+        QUERY_ANSWERS.inc(source="llm")
+
+        if answer and self.answer_cache is not None:
+            self.answer_cache.store(case_id, query_embedding, answer, version)
+        return answer
+
 
 # --- 5. RETRIEVE CASE DETAILS FROM CHROMA ---
-def retrieve_case_details(rag_service: 'RAGService', case_id: str) -> str:
-    """Retrieve case details from Chroma DB using case_id."""
+def retrieve_case_details(rag_service: 'RAGService', case_id: str, refresh: bool = False) -> str:
+    """Retrieve every chunk of a case from Chroma DB using case_id."""
     try:
         print(f"Retrieving case details for case_id: {case_id}...")
         
-        # Query Chroma collection for documents matching this case_id
-        # Try querying by case_id as a filter or search term
-        results = rag_service.collection.query(
-            query_texts=[f"case_id: {case_id}"],
-            n_results=10
-        )
-        
-        documents = results.get("documents", [[]])[0]
+        # Exact metadata match on case_id, all pages; no vector search involved
+        with span("retrieval", case_id=case_id):
+            documents = rag_service.fetch_case_chunks(case_id, refresh=refresh)["documents"]
         
         if documents:
-            context_text = "\n".join(documents)
+            context_text = join_chunks(documents)
             print(f"Retrieved {len(documents)} document(s) from Chroma DB.\n")
             return context_text
         else:
@@ -195,20 +510,81 @@ def retrieve_case_details(rag_service: 'RAGService', case_id: str) -> str:
         return ""
 
 
-# --- 6. MAIN GENERATION LOOP ---
-def generate_chargesheet(context_text: str, case_id: str = "") -> str:
-    """Generate the complete chargesheet document."""
-    final_document = ""
+def retrieve_section_contexts(rag_service: 'RAGService', case_id: str, top_k: Optional[int] = None) -> dict:
+    """Pick each section's context with its own retrieval queries.
 
-    print(f"Starting Generation for Case {case_id}...\n")
+    Every section's queries are embedded in one `encode` batch and sent in a
+    single case-filtered `collection.query`. Per section, hits are merged
+    (best distance per chunk), deduplicated and packed by relevance into
+    the section's prompt budget, then laid out in document order. Returns
+    {section_name: context_text}.
+    """
+    top_k = top_k or SECTION_TOP_K
 
+    owners, queries = [], []
     for section_name, section_data in CHARGESHEET_SECTIONS.items():
-        print(f"Generating {section_name}...")
-        
-        # Prepare the Prompt
-        few_shot_text = format_few_shot(section_data["examples"])
-        
-        system_prompt = f"""You are a Legal Drafting Assistant for Indian Criminal Law. 
+        for query in section_data.get("queries", []):
+            owners.append(section_name)
+            queries.append(query)
+    if not queries:
+        return {}
+
+    with span("embed", queries=len(queries)):
+        embeddings = rag_service.embedder.encode(queries)
+    with span("retrieval", case_id=case_id, queries=len(queries)):
+        results = rag_service.collection.query(
+            query_embeddings=embeddings.tolist(),
+            n_results=top_k,
+            where={CASE_ID_FIELD: case_id},
+            include=["documents", "metadatas", "distances"]
+        )
+
+    hits = {name: {} for name in CHARGESHEET_SECTIONS}
+    for section_name, ids, documents, metadatas, distances in zip(
+            owners, results["ids"], results["documents"], results["metadatas"], results["distances"]):
+        for chunk_id, document, metadata, distance in zip(ids, documents, metadatas, distances):
+            best = hits[section_name].get(chunk_id)
+            if best is None or distance < best[0]:
+                hits[section_name][chunk_id] = (distance, document, metadata or {})
+
+    section_contexts = {}
+    for section_name, section_hits in hits.items():
+        section_hits = list(section_hits.values())
+        documents, _ = PROMPT_BUILDER.pack(
+            [document for _, document, _ in section_hits],
+            PROMPT_BUILDER.budget(section_name),
+            scores=[-distance for distance, _, _ in section_hits],
+            positions=[chunk_position(metadata) for _, _, metadata in section_hits]
+        )
+        section_contexts[section_name] = join_chunks(documents)
+    return section_contexts
+
+
+def retrieve_generation_contexts(rag_service: 'RAGService', case_id: str) -> Tuple[str, dict]:
+    """Context for generating a case: (full case text, per-section contexts).
+
+    The full case text is only fetched when some section has no targeted
+    context of its own (or SECTION_RETRIEVAL is off); it is "" otherwise.
+    """
+    section_contexts = {}
+    if SECTION_RETRIEVAL:
+        try:
+            section_contexts = retrieve_section_contexts(rag_service, case_id)
+        except Exception as e:
+            print(f"ERROR in section retrieval, falling back to full case context: {e}")
+
+    context_text = ""
+    if not all(section_contexts.get(name) for name in CHARGESHEET_SECTIONS):
+        context_text = retrieve_case_details(rag_service, case_id)
+    return context_text, section_contexts
+
+
+# --- 6. MAIN GENERATION LOOP ---
+def section_system_prompt(section_name: str, section_data: dict) -> str:
+    """Static system prompt of a section; rendered once by PROMPT_BUILDER."""
+    few_shot_text = format_few_shot(section_data["examples"])
+
+    system_prompt = f"""You are a Legal Drafting Assistant for Indian Criminal Law. 
         Task: Draft the section '{section_name}' for a Police Final Report (Chargesheet).
         
         GUIDELINES:
@@ -216,85 +592,314 @@ def generate_chargesheet(context_text: str, case_id: str = "") -> str:
         
         {few_shot_text}
         """
-        
-        user_prompt = f"Using the following facts, generate the section '{section_name}':\n\n{context_text}"
+    return system_prompt
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
 
-        # Call LLM
-        content = askGemini(messages)
-        
-        if content:
-            final_document += f"\n\n{'='*30}\nSECTION: {section_name}\n{'='*30}\n{content}"
-            print(f" -> {section_name} Completed.")
-        else:
-            print(f" -> {section_name} Failed.")
-        
-        time.sleep(1) # Polite delay
+PROMPT_BUILDER = PromptBuilder(
+    CHARGESHEET_SECTIONS,
+    section_system_prompt,
+    context_tokens=PROMPT_CONTEXT_TOKENS,
+    dedupe_threshold=PROMPT_DEDUPE_THRESHOLD
+)
+
+
+def build_section_messages(section_name: str, context_text: str) -> list:
+    """Build the chat messages for one chargesheet section."""
+    return PROMPT_BUILDER.build(section_name, context_text)[0]
+
+
+def report_prompt(section_name: str, stats: dict):
+    PROMPT_TOKENS.observe(stats["prompt_tokens"], section=section_name)
+    removed = stats["chunks_duplicate"] + stats["chunks_dropped"]
+    print(f"   {section_name} prompt: ~{stats['prompt_tokens']} tokens "
+          f"({stats['prefix_tokens']} prefix + {stats['context_tokens']} context"
+          + (f", {stats['chunks_duplicate']} duplicate / {stats['chunks_dropped']} over-budget chunks removed" if removed else "")
+          + ")")
+
+
+def generate_section(section_name: str, context_text: str, use_cache: bool = True, refresh: bool = False) -> str:
+    """Generate a single section. Returns "" on failure."""
+    print(f"Generating {section_name}...")
+    messages, stats = PROMPT_BUILDER.build(section_name, context_text)
+    report_prompt(section_name, stats)
+
+    with span("section", section=section_name, **stats):
+        content = askGemini(messages, use_cache=use_cache, refresh=refresh, inflight=GENERATION_INFLIGHT)
+
+    if content:
+        print(f" -> {section_name} Completed.")
+    else:
+        print(f" -> {section_name} Failed.")
+    return content
+
+
+def section_header(section_name: str) -> str:
+    return f"\n\n{'='*30}\nSECTION: {section_name}\n{'='*30}\n"
+
 
+def assemble_document(section_contents: dict) -> str:
+    """Join generated sections in CHARGESHEET_SECTIONS order, skipping failures."""
+    final_document = ""
+    for section_name in CHARGESHEET_SECTIONS:
+        content = section_contents.get(section_name)
+        if content:
+            final_document += section_header(section_name) + content
     return final_document
 
-# --- 7. SAVE OUTPUT AND START SERVER ---
-if __name__ == "__main__":
-    import sys
-    
-    # Get case_id from command line argument or use default
-    case_id = sys.argv[1] if len(sys.argv) > 1 else "68eaa843963b266f12d007af"
-    
-    # Initialize RAG Service to access Chroma DB
-    print("Initializing RAG Service...")
-    try:
-        rag_service = RAGService()
-    except Exception as e:
-        print(f"ERROR initializing RAG Service: {e}")
-        print("Make sure CHROMA_API_KEY, CHROMA_TENANT, CHROMA_DATABASE are set in .env")
-        sys.exit(1)
-    
-    # Retrieve case details from Chroma DB
-    context_text = retrieve_case_details(rag_service, case_id)
-    
+
+def section_input_hash(messages: list) -> str:
+    """Hash of everything that determines a section's output: models, prompt, sampling.
+
+    Deliberately the same key as COMPLETION_CACHE uses, so an artifact and
+    the cached reply for the same prompt can be matched up.
+    """
+    return completion_key(POOL_MODEL_ID, messages, LLM_TEMPERATURE, LLM_MAX_TOKENS)
+
+
+def extraction_context(context_text: str, section_contexts: dict) -> str:
+    """Context for the extraction call: the full case text, or else the
+    targeted contexts of the structured sections, deduplicated and fitted
+    to PROMPT_CONTEXT_TOKENS."""
     if not context_text:
-        print(f"WARNING: No case details found for {case_id}")
-        print("Using placeholder context for chargesheet generation...")
-        context_text = f"Case {case_id}. Details to be retrieved from investigation documents."
-    
-    # Generate the chargesheet with retrieved context
-    final_document = generate_chargesheet(context_text, case_id)
-    
+        context_text = join_chunks([section_contexts.get(name) or "" for name in STRUCTURED_SECTIONS])
+    queries = [query for name in STRUCTURED_SECTIONS for query in CHARGESHEET_SECTIONS.get(name, {}).get("queries", [])]
+    return PROMPT_BUILDER.fit(context_text, PROMPT_CONTEXT_TOKENS, queries)[0]
+
+
+def extract_case_facts(messages: list, use_cache: bool = True, refresh: bool = False) -> Optional[CaseFacts]:
+    """One LLM call returning the case's structured facts, or None if the
+    reply could not be validated."""
+    print("Extracting structured case facts...")
+    with span("extraction"):
+        facts = parse_case_facts(askGemini(messages, use_cache=use_cache, refresh=refresh,
+                                           inflight=GENERATION_INFLIGHT))
+    if facts is None:
+        print(" -> Extraction Failed.")
+        if COMPLETION_CACHE:
+            # Don't keep serving a reply that doesn't parse.
+            COMPLETION_CACHE.invalidate(section_input_hash(messages))
+    else:
+        print(f" -> Extraction Completed ({len(facts.properties)} properties, {len(facts.witnesses)} witnesses).")
+    return facts
+
+
+_EXTRACTION_TASK = "__extraction__"
+
+
+def generate_chargesheet(context_text: str, case_id: str = "", max_workers: Optional[int] = None,
+                         use_cache: bool = True, refresh: bool = False,
+                         section_contexts: Optional[dict] = None, incremental: bool = False,
+                         artifacts: Optional[SectionArtifactStore] = None, mode: Optional[str] = None) -> str:
+    """Generate the complete chargesheet document.
+
+    Sections are sent concurrently (up to `max_workers`, default
+    LLM_MAX_CONCURRENCY) and paced by LLM_RATE_LIMITER; pass `max_workers=1`
+    for the sequential behaviour. `use_cache`/`refresh` are passed to askGemini.
+    A section found in `section_contexts` is prompted with that context
+    instead of `context_text`.
+
+    Generated sections are saved to `artifacts` (default SECTION_ARTIFACTS)
+    with their input hash. With `incremental=True`, sections whose stored
+    hash matches the current prompt are reused and only the rest are sent
+    to the LLM.
+
+    With `mode="structured"` (default GENERATION_MODE) the table sections
+    are rendered from a single extraction call that runs alongside the
+    narrative sections; if the extraction fails they are generated per
+    section as usual.
+    """
+    section_contexts = section_contexts or {}
+    if max_workers is None:
+        max_workers = LLM_MAX_CONCURRENCY
+    if artifacts is None and case_id:
+        artifacts = SECTION_ARTIFACTS
+    mode = mode or GENERATION_MODE
+
+    print(f"Starting Generation for Case {case_id}...\n")
+
+    section_names = list(CHARGESHEET_SECTIONS)
+    structured = [name for name in section_names if name in STRUCTURED_SECTIONS] if mode == "structured" else []
+    extraction_messages = build_extraction_messages(extraction_context(context_text, section_contexts)) if structured else None
+
+    def section_messages(name: str) -> list:
+        return build_section_messages(name, section_contexts.get(name) or context_text)
+
+    input_hashes = {
+        name: section_input_hash(extraction_messages if name in structured else section_messages(name))
+        for name in section_names
+    }
+
+    contents = {}
+    if incremental and artifacts is not None:
+        for name in section_names:
+            stored = artifacts.load(case_id, name)
+            if stored and stored.get("content") and stored.get("input_hash") == input_hashes[name]:
+                contents[name] = stored["content"]
+        if contents:
+            print(f"Reusing unchanged section(s): {', '.join(contents)}")
+
+    pending = [name for name in section_names if name not in contents]
+    to_render = [name for name in pending if name in structured]
+    # The extraction goes first: it replaces several sections and is the longest call.
+    tasks = ([_EXTRACTION_TASK] if to_render else []) + [name for name in pending if name not in to_render]
+
+    def run_task(task: str):
+        if task == _EXTRACTION_TASK:
+            return extract_case_facts(extraction_messages, use_cache=use_cache, refresh=refresh)
+        return generate_section(task, section_contexts.get(task) or context_text,
+                                use_cache=use_cache, refresh=refresh)
+
+    with span("case", case_id=case_id, regenerated=len(pending), mode=mode):
+        results = dict(zip(tasks, run_ordered(run_task, tasks, max_workers=max_workers,
+                                              rate_limiter=LLM_RATE_LIMITER)))
+        facts = results.pop(_EXTRACTION_TASK, None)
+        if to_render and facts is not None:
+            results.update((name, STRUCTURED_SECTIONS[name](facts)) for name in to_render)
+        elif to_render:
+            print(f"Falling back to per-section generation for: {', '.join(to_render)}")
+            input_hashes.update((name, section_input_hash(section_messages(name))) for name in to_render)
+            results.update(zip(to_render, run_ordered(
+                lambda name: generate_section(name, section_contexts.get(name) or context_text,
+                                              use_cache=use_cache, refresh=refresh),
+                to_render,
+                max_workers=max_workers,
+                rate_limiter=LLM_RATE_LIMITER
+            )))
+
+    for name in pending:
+        content = results.get(name, "")
+        contents[name] = content
+        if content and artifacts is not None:
+            artifacts.save(case_id, name, input_hashes[name], content)
+
+    return assemble_document(contents)
+
+
+_STREAM_END = object()
+
+
+def stream_chargesheet(context_text: str, case_id: str = "", max_workers: Optional[int] = None,
+                       section_contexts: Optional[dict] = None) -> Iterator[Tuple[str, dict]]:
+    """Generate the chargesheet and yield (event, data) pairs as tokens arrive.
+
+    All sections are requested concurrently, but events are emitted in
+    CHARGESHEET_SECTIONS order: the first section streams live while later
+    ones buffer, so time-to-first-token is one section's first token and the
+    total is roughly the slowest section.
+    """
+    if max_workers is None:
+        max_workers = LLM_MAX_CONCURRENCY
+    section_contexts = section_contexts or {}
+
+    section_names = list(CHARGESHEET_SECTIONS)
+    queues = {name: queue.Queue() for name in section_names}
+    cancel = threading.Event()
+
+    def produce(section_name, cancel):
+        out = queues[section_name]
+        try:
+            LLM_RATE_LIMITER.acquire()
+            if cancel.is_set():
+                return
+            messages, stats = PROMPT_BUILDER.build(section_name, section_contexts.get(section_name) or context_text)
+            report_prompt(section_name, stats)
+            deltas = askGeminiStream(messages, inflight=GENERATION_INFLIGHT)
+            try:
+                for delta in deltas:
+                    if cancel.is_set():
+                        break
+                    out.put(delta)
+            finally:
+                # Closing the generator drops the HTTP stream and frees the generation slot.
+                deltas.close()
+        except Exception as e:
+            print(f"ERROR streaming {section_name}: {e}")
+            out.put(e)
+        finally:
+            out.put(_STREAM_END)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(section_names))))
+    try:
+        for section_name in section_names:
+            pool.submit(contextvars.copy_context().run, produce, section_name, cancel)
+
+        yield "start", {"case_id": case_id, "sections": section_names}
+        for section_name in section_names:
+            yield "section_start", {"section": section_name, "header": section_header(section_name)}
+            received = False
+            error = None
+            while True:
+                item = queues[section_name].get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    error = str(item)
+                    continue
+                received = True
+                yield "token", {"section": section_name, "text": item}
+            status = "completed" if received and error is None else "failed"
+            yield "section_end", {"section": section_name, "status": status, "error": error}
+        yield "done", {"case_id": case_id}
+    finally:
+        # Client went away: stop sections that are streaming, don't start the rest.
+        cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# --- 7. END-TO-END CASE PIPELINE ---
+def output_path_for(case_id: str, output_dir: str = ".") -> str:
+    return os.path.join(output_dir, f"Generated_Chargesheet_{case_id}.txt")
+
+
+def trace_path_for(case_id: str, output_dir: str = ".") -> str:
+    return os.path.join(output_dir, f"Generated_Chargesheet_{case_id}.trace.json")
+
+
+def generate_case_chargesheet(rag_service: 'RAGService', case_id: str, output_dir: str = ".",
+                              incremental: bool = False, mode: Optional[str] = None) -> str:
+    """Retrieve a case, generate its chargesheet and save it. Returns the document.
+
+    A JSON timing trace (retrieval, per-section LLM calls, token usage) is
+    written next to the chargesheet. `incremental=True` only regenerates
+    sections whose retrieved context or prompt changed since the last run.
+    `mode` overrides GENERATION_MODE.
+    """
+    # Create the output directory up front, not after every section is generated.
+    os.makedirs(output_dir, exist_ok=True)
+    with trace_case(case_id) as trace:
+        # Retrieve case details from Chroma DB
+        context_text, section_contexts = retrieve_generation_contexts(rag_service, case_id)
+
+        if not context_text and not any(section_contexts.values()):
+            print(f"WARNING: No case details found for {case_id}")
+            print("Using placeholder context for chargesheet generation...")
+            context_text = f"Case {case_id}. Details to be retrieved from investigation documents."
+
+        # Generate the chargesheet with retrieved context
+        final_document = generate_chargesheet(context_text, case_id, section_contexts=section_contexts,
+                                              incremental=incremental, mode=mode)
+
     # Save to file
-    output_filename = f"Generated_Chargesheet_{case_id}.txt"
+    output_filename = output_path_for(case_id, output_dir)
     with open(output_filename, "w", encoding="utf-8") as f:
         f.write(final_document)
-    
+    trace.write(trace_path_for(case_id, output_dir))
+
     print(f"\nProcessing Complete. Output saved to '{output_filename}'.")
-    
-    # Ask if user wants to start the FastAPI server
-    start_server = input("\nDo you want to start the FastAPI server? (yes/no): ").strip().lower()
-    
-    if start_server in ['yes', 'y']:
-        print("Starting FastAPI server...")
-        
-        # --- FastAPI App ---
-        app = FastAPI(title="RAG Retrieval API")
-        app.rag_service = rag_service  # Store RAG service in app context
-
-        @app.on_event("startup")
-        async def startup_event():
-            print("RAG Service Initialized.")
-
-        @app.post("/query/{case_id}", response_model=QueryResponse)
-        async def query_case(case_id: str, request: QueryRequest):
-            if not app.rag_service:
-                raise HTTPException(status_code=503, detail="Service starting up...")
-            try:
-                answer = app.rag_service.process_query(request.query, case_id)
-                return QueryResponse(answer=answer, retrieved_count=5)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=str(e))
+    return final_document
 
-        uvicorn.run(app, host="0.0.0.0", port=8000)
-    else:
-        print("Exiting. FastAPI server not started.")
\ No newline at end of file
+
+# --- 8. COMMAND LINE ---
+if __name__ == "__main__":
+    import sys
+
+    # The CLI lives in cli.py. Register this module as `main` first so cli,
+    # batch and server import it instead of executing main.py a second time
+    # (which would duplicate the LLM client, caches and concurrency limits).
+    sys.modules["main"] = sys.modules[__name__]
+    from cli import run
+    run()
@@ -0,0 +1,190 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+
+# --- 1. PROMETHEUS-STYLE METRICS ---
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_text(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(key)} {value}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_label_text(key, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_label_text(key, le)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_text(key)} {series[-1]}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("chargesheet_stage_seconds", "Wall time per pipeline stage (embed, retrieval, llm, section, case).")
+LLM_REQUESTS = Counter("llm_requests_total", "LLM calls by outcome (ok, error, cache_hit).")
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported in LLM response usage, by kind (prompt, completion).")
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_completion_tokens_per_second", "Completion tokens per second of LLM wall time.",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+)
+EMBEDDING_CACHE = Counter("embedding_cache_total", "Embedding lookups by result (hit, miss).")
+EMBEDDING_BATCH_SIZE = Histogram(
+    "embedding_batch_size", "Texts per encode() call sent to the embedding model.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens_estimated", "Estimated prompt tokens per section request, by section.",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+)
+QUERY_ANSWERS = Counter("query_answers_total", "/query answers by source (llm, semantic_cache, coalesced).")
+
+REGISTRY = [STAGE_SECONDS, LLM_REQUESTS, LLM_TOKENS, LLM_TOKENS_PER_SECOND, EMBEDDING_CACHE, EMBEDDING_BATCH_SIZE,
+            PROMPT_TOKENS, QUERY_ANSWERS]
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition of every registered metric."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# --- 2. PER-CASE TRACES ---
+class Trace:
+    """Structured timing record for one case, written next to its chargesheet."""
+
+    def __init__(self, case_id: str):
+        self.case_id = case_id
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        llm_spans = [s for s in spans if s["stage"] == "llm"]
+        return {
+            "case_id": self.case_id,
+            "started_at": self.started_at,
+            "totals": {
+                "case_seconds": sum(s["seconds"] for s in spans if s["stage"] == "case"),
+                "embed_seconds": sum(s["seconds"] for s in spans if s["stage"] == "embed"),
+                "retrieval_seconds": sum(s["seconds"] for s in spans if s["stage"] == "retrieval"),
+                "llm_seconds": sum(s["seconds"] for s in llm_spans),
+                "prompt_tokens": sum(s.get("prompt_tokens") or 0 for s in llm_spans),
+                "completion_tokens": sum(s.get("completion_tokens") or 0 for s in llm_spans),
+            },
+            "spans": spans,
+        }
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+CURRENT_TRACE: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("CURRENT_TRACE", default=None)
+
+
+@contextmanager
+def trace_case(case_id: str):
+    """Collect every span recorded in this context (and its copied contexts) into a Trace."""
+    trace = Trace(case_id)
+    token = CURRENT_TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        CURRENT_TRACE.reset(token)
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """Time a block, record it in STAGE_SECONDS and in the current trace.
+
+    The yielded dict can be filled in with extra attributes (token counts,
+    section name...) before the block exits.
+    """
+    started_at = time.time()
+    start = time.perf_counter()
+    record = dict(attrs)
+    error = None
+    try:
+        yield record
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = CURRENT_TRACE.get()
+        if trace is not None:
+            record.update(stage=stage, started_at=started_at, seconds=round(elapsed, 6))
+            if error is not None:
+                record["error"] = str(error)
+            trace.add(record)
+
+
+def record_llm_usage(record: dict, response: dict, elapsed: float):
+    """Copy `usage` from a chat-completions response into metrics and a span record."""
+    usage = response.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    record["prompt_tokens"] = prompt_tokens
+    record["completion_tokens"] = completion_tokens
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+        if elapsed > 0:
+            record["tokens_per_second"] = round(completion_tokens / elapsed, 2)
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / elapsed)
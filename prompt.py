@@ -1,10 +1,17 @@
-import requests
+import os
 import json
-import time
+from concurrency import TokenBucket, run_ordered
+from llm_client import LLMClient, LLMEndpoint
 
 # --- CONFIGURATION ---
 LLM_API_URL = "https://llama-3b.greenrock-7c76d2df.centralindia.azurecontainerapps.io/v1/chat/completions"
 MODEL_ID = "llama3.2-vision:11b"
+LLM_CLIENT = LLMClient([LLMEndpoint(LLM_API_URL, MODEL_ID)], read_timeout=120)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_RATE_LIMITER = TokenBucket(
+    rate=float(os.getenv("LLM_RATE_PER_SEC", "1")),
+    capacity=float(os.getenv("LLM_RATE_BURST", "4"))
+)
 
 # --- 1. REAL-WORLD EXAMPLES (Extracted from your PDF) ---
 # We organize examples by SECTION so the model focuses only on what matters for that specific part.
@@ -78,15 +85,11 @@ CHARGESHEET_SECTIONS = {
 def askGemini(messages):
     """Call the LLM API."""
     try:
-        payload = {
-            "model": MODEL_ID,
-            "messages": messages,
-            "max_tokens": 3000,
-            "temperature": 0.1  # Low temperature for factual consistency
-        }
-        response = requests.post(LLM_API_URL, json=payload, timeout=120)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        return LLM_CLIENT.complete(
+            messages,
+            max_tokens=3000,
+            temperature=0.1  # Low temperature for factual consistency
+        )
     except Exception as e:
         print(f"ERROR: {e}")
         return ""
@@ -112,13 +115,10 @@ Witnesses: 1. Victim (Minor), 2. Mother of Victim (Complainant), 3. Panch Witnes
 """
 
 # --- 5. MAIN GENERATION LOOP ---
-final_document = ""
-
-print(f"Starting Generation for Case 789/2025...\n")
-
-for section_name, section_data in CHARGESHEET_SECTIONS.items():
+def generate_section(section_name):
     print(f"Generating {section_name}...")
-    
+    section_data = CHARGESHEET_SECTIONS[section_name]
+
     # Prepare the Prompt
     few_shot_text = format_few_shot(section_data["examples"])
     
@@ -142,12 +142,22 @@ for section_name, section_data in CHARGESHEET_SECTIONS.items():
     content = askGemini(messages)
     
     if content:
-        final_document += f"\n\n{'='*30}\nSECTION: {section_name}\n{'='*30}\n{content}"
         print(f" -> {section_name} Completed.")
     else:
         print(f" -> {section_name} Failed.")
-    
-    time.sleep(1) # Polite delay
+    return content
+
+print(f"Starting Generation for Case 789/2025...\n")
+
+# Sections are independent: send them together, assemble in declared order.
+section_names = list(CHARGESHEET_SECTIONS)
+contents = run_ordered(generate_section, section_names,
+                       max_workers=LLM_MAX_CONCURRENCY, rate_limiter=LLM_RATE_LIMITER)
+
+final_document = ""
+for section_name, content in zip(section_names, contents):
+    if content:
+        final_document += f"\n\n{'='*30}\nSECTION: {section_name}\n{'='*30}\n{content}"
 
 # --- 6. SAVE OUTPUT ---
 with open("Generated_Chargesheet.txt", "w", encoding="utf-8") as f:
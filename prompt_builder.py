@@ -0,0 +1,155 @@
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Retrieved chunks are joined with a blank line so they can be split apart again.
+CHUNK_SEPARATOR = "\n\n"
+USER_TEMPLATE = "Using the following facts, generate the section '{section_name}':\n\n{context}"
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+_WORD = re.compile(r"\w+")
+
+
+# --- 1. TOKENS AND CHUNKS ---
+def count_tokens(text: str) -> int:
+    """Tokenizer-free estimate for SentencePiece/BPE models: one token per
+    punctuation mark and one per started 4 characters of each word."""
+    return sum((len(piece) + 3) // 4 for piece in _PIECE.findall(text or ""))
+
+
+def join_chunks(chunks: Sequence[str]) -> str:
+    return CHUNK_SEPARATOR.join(chunk.strip() for chunk in chunks if chunk and chunk.strip())
+
+
+def split_chunks(text: str) -> List[str]:
+    return [chunk.strip() for chunk in (text or "").split(CHUNK_SEPARATOR) if chunk.strip()]
+
+
+def _shingles(text: str, size: int = 5) -> frozenset:
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def dedupe_chunks(chunks: Sequence[str], threshold: float = 0.8) -> List[int]:
+    """Indices of the chunks to keep, in input order.
+
+    A chunk is dropped if it equals an earlier one ignoring case and
+    whitespace, or if the Jaccard similarity of their word 5-shingles is at
+    least `threshold` (overlapping splits, re-ingested pages, OCR variants).
+    """
+    kept, kept_shingles, seen = [], [], set()
+    for i, chunk in enumerate(chunks):
+        normalized = " ".join(chunk.lower().split())
+        if normalized in seen:
+            continue
+        shingles = _shingles(chunk)
+        duplicate = False
+        for other in kept_shingles:
+            # Jaccard >= t needs the smaller set to be at least t times the larger.
+            if min(len(shingles), len(other)) < threshold * max(len(shingles), len(other)):
+                continue
+            if len(shingles & other) >= threshold * len(shingles | other):
+                duplicate = True
+                break
+        if duplicate:
+            continue
+        seen.add(normalized)
+        kept.append(i)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def lexical_scores(chunks: Sequence[str], queries: Sequence[str]) -> List[float]:
+    """Share of the query terms (longer than 2 characters) found in each chunk."""
+    terms = {word for query in queries for word in _WORD.findall(query.lower()) if len(word) > 2}
+    if not terms:
+        return [0.0] * len(chunks)
+    return [len(terms & set(_WORD.findall(chunk.lower()))) / len(terms) for chunk in chunks]
+
+
+# --- 2. BUILDER ---
+class PromptBuilder:
+    """Assembles section prompts from a fixed prefix and a budgeted context.
+
+    Each section's system prompt (instruction + few-shot examples) is
+    rendered once here and reused verbatim, so every request for a section
+    starts with byte-identical text and the server's prefix cache can hit.
+    The context goes through `fit`: duplicates are removed and, when it is
+    over the section's budget (`context_tokens` in the section definition,
+    else `context_tokens` here), the chunks that match the section's queries
+    best are kept, in their original order.
+    """
+
+    def __init__(self, sections: Dict[str, dict], system_prompt: Callable[[str, dict], str],
+                 context_tokens: int = 4000, dedupe_threshold: float = 0.8,
+                 user_template: str = USER_TEMPLATE):
+        self.sections = sections
+        self.context_tokens = context_tokens
+        self.dedupe_threshold = dedupe_threshold
+        self.user_template = user_template
+        self.prefixes = {name: system_prompt(name, data) for name, data in sections.items()}
+        self.prefix_tokens = {name: count_tokens(prefix) for name, prefix in self.prefixes.items()}
+
+    def budget(self, section_name: str) -> int:
+        return self.sections[section_name].get("context_tokens") or self.context_tokens
+
+    def pack(self, chunks: Sequence[str], budget: int, scores: Optional[Sequence[float]] = None,
+             positions: Optional[Sequence] = None) -> Tuple[List[str], dict]:
+        """Dedupe `chunks` and fill `budget` tokens, best `scores` first.
+
+        The result is laid out by `positions` (default: input order). A single
+        chunk larger than the whole budget is cut to fit rather than dropped.
+        """
+        order = list(range(len(chunks)))
+        if scores is not None:
+            order.sort(key=lambda i: scores[i], reverse=True)
+        unique = [order[i] for i in dedupe_chunks([chunks[i] for i in order], self.dedupe_threshold)]
+
+        packed, used = [], 0
+        for i in unique:
+            chunk = chunks[i]
+            cost = count_tokens(chunk)
+            if used + cost > budget:
+                if packed:
+                    continue
+                chunk = chunk[:max(0, budget) * 4]
+                cost = count_tokens(chunk)
+            packed.append((i, chunk))
+            used += cost
+
+        if positions is None:
+            positions = range(len(chunks))
+        positions = list(positions)
+        packed.sort(key=lambda item: positions[item[0]])
+        texts = [chunk for _, chunk in packed]
+        stats = {
+            "chunks_in": len(chunks),
+            "chunks_duplicate": len(chunks) - len(unique),
+            "chunks_dropped": len(unique) - len(packed),
+            "context_tokens": used,
+        }
+        return texts, stats
+
+    def fit(self, context_text: str, budget: int, queries: Sequence[str] = ()) -> Tuple[str, dict]:
+        """Dedupe a context and, if it is over `budget`, rank chunks against `queries`."""
+        chunks = split_chunks(context_text)
+        scores = None
+        if sum(count_tokens(chunk) for chunk in chunks) > budget:
+            scores = lexical_scores(chunks, queries)
+        texts, stats = self.pack(chunks, budget, scores)
+        return join_chunks(texts), stats
+
+    def build(self, section_name: str, context_text: str) -> Tuple[list, dict]:
+        """Chat messages for a section, plus prompt size stats."""
+        section_data = self.sections[section_name]
+        queries = list(section_data.get("queries", [])) + [section_data.get("instruction", "")]
+        context, stats = self.fit(context_text, self.budget(section_name), queries)
+        user_prompt = self.user_template.format(section_name=section_name, context=context)
+        stats["prefix_tokens"] = self.prefix_tokens[section_name]
+        stats["prompt_tokens"] = stats["prefix_tokens"] + count_tokens(user_prompt)
+        messages = [
+            {"role": "system", "content": self.prefixes[section_name]},
+            {"role": "user", "content": user_prompt}
+        ]
+        return messages, stats
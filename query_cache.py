@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+
+# --- 1. SINGLE-FLIGHT ---
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key runs `fn`; callers arriving while it is in
+    flight wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable):
+        """Returns (result, shared) where `shared` is True for waiting callers."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result(), False
+
+
+# --- 2. SEMANTIC ANSWER CACHE ---
+class SemanticAnswerCache:
+    """Per-case store of (query embedding, answer) pairs.
+
+    A lookup returns the stored answer whose query embedding has the highest
+    cosine similarity with the new one, if that is at least `threshold`.
+    Entries are tagged with the case's document version; a lookup or store
+    with a different version drops everything cached for that case.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_per_case: int = 256, max_age: Optional[float] = 24 * 3600):
+        self.threshold = threshold
+        self.max_per_case = max_per_case
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._cases: Dict[str, dict] = {}
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _entry(self, case_id: str, version: Optional[str]) -> dict:
+        entry = self._cases.get(case_id)
+        if entry is None or entry["version"] != version:
+            entry = self._cases[case_id] = {"version": version, "vectors": [], "answers": [], "created": []}
+        return entry
+
+    def lookup(self, case_id: str, embedding, version: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            entry = self._entry(case_id, version)
+            if self.max_age is not None:
+                cutoff = time.time() - self.max_age
+                keep = [i for i, created in enumerate(entry["created"]) if created >= cutoff]
+                if len(keep) != len(entry["created"]):
+                    for field in ("vectors", "answers", "created"):
+                        entry[field] = [entry[field][i] for i in keep]
+            if not entry["vectors"]:
+                return None
+            similarities = np.stack(entry["vectors"]) @ self._unit(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return entry["answers"][best]
+            return None
+
+    def store(self, case_id: str, embedding, answer: str, version: Optional[str] = None):
+        with self._lock:
+            entry = self._entry(case_id, version)
+            entry["vectors"].append(self._unit(embedding))
+            entry["answers"].append(answer)
+            entry["created"].append(time.time())
+            if len(entry["vectors"]) > self.max_per_case:
+                for field in ("vectors", "answers", "created"):
+                    entry[field] = entry[field][-self.max_per_case:]
+
+    def invalidate(self, case_id: str):
+        with self._lock:
+            self._cases.pop(case_id, None)
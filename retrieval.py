@@ -0,0 +1,345 @@
+import bisect
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Protocol
+
+import numpy as np
+
+
+# --- 1. BACKEND INTERFACE ---
+class RetrievalBackend(Protocol):
+    """What RAGService needs from a vector store.
+
+    The method names and result shapes mirror the chromadb Collection API
+    (`query` returns one list per query embedding), so a Chroma collection
+    can be used as a backend as-is and callers don't care which one they got.
+    """
+
+    def count(self) -> int: ...
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None): ...
+
+    def delete(self, ids=None, where=None): ...
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")) -> dict: ...
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None,
+              include=("documents", "metadatas", "distances")) -> dict: ...
+
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """Evaluate the subset of Chroma `where` filters we use: equality, $eq, $in, $and."""
+    if not where:
+        return True
+    for key, value in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in value):
+                return False
+        elif isinstance(value, dict):
+            if "$eq" in value and metadata.get(key) != value["$eq"]:
+                return False
+            if "$in" in value and metadata.get(key) not in value["$in"]:
+                return False
+        elif metadata.get(key) != value:
+            return False
+    return True
+
+
+# --- 2. LOCAL EMBEDDED INDEX ---
+class LocalVectorIndex(RetrievalBackend):
+    """Embedded vector index: a memory-mapped float32 matrix plus a JSONL record log.
+
+    Vectors are L2-normalised on insert so search is a single matrix-vector
+    product and `distances` are cosine distances (1 - similarity). With
+    `partition_by` set (default "case_id"), rows are grouped by that
+    metadata field and a `where` on it only scans that case's rows.
+
+    Layout under `path`: `vectors.f32` (capacity x dim, grown by doubling),
+    `index.json` (dim) and `records.jsonl`, which gets one line per upserted
+    record (id, document, metadata) or deleted id. Rows are numbered in
+    order of each id's first line and a later line for an id replaces the
+    earlier one, so an upsert only appends its own records instead of
+    rewriting the index. Deleted rows are left unused.
+    """
+
+    def __init__(self, path: str, dim: Optional[int] = None, embedder=None,
+                 partition_by: Optional[str] = "case_id"):
+        self.path = path
+        self.embedder = embedder
+        self.partition_by = partition_by
+        self._lock = threading.RLock()
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._meta_path = os.path.join(path, "index.json")
+        self._records_path = os.path.join(path, "records.jsonl")
+
+        self.dim = dim
+        self._ids: List[str] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[dict] = []
+        self._row: Dict[str, int] = {}  # live ids only
+        self._deleted = set()  # rows of deleted ids
+        self._partition_rows: Dict[str, List[int]] = {}  # partition key -> sorted rows
+        self._partitions: Dict[str, np.ndarray] = {}  # the same rows as arrays, built on first use
+        self._matrix = None
+        self._capacity = 0
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                     shape=(os.path.getsize(self._vectors_path) // (4 * self.dim), self.dim))
+            self._capacity = self._matrix.shape[0]
+            if os.path.exists(self._records_path):
+                self._replay_records()
+
+    # -- storage helpers --
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity:
+            return
+        new_capacity = max(rows, self._capacity * 2, 1024)
+        if self._matrix is not None:
+            self._matrix.flush()
+            del self._matrix
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+        self._capacity = new_capacity
+
+    def _replay_records(self):
+        with open(self._records_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash
+                if record.get("deleted"):
+                    self._delete_record(record["id"])
+                else:
+                    self._set_record(record["id"], record["document"], record["metadata"])
+
+    def _partition_key(self, metadata: Optional[dict]):
+        return (metadata or {}).get(self.partition_by)
+
+    def _add_to_partition(self, row: int, key):
+        rows = self._partition_rows.setdefault(key, [])
+        if rows and rows[-1] > row:
+            bisect.insort(rows, row)
+        else:
+            rows.append(row)
+        self._partitions.pop(key, None)
+
+    def _remove_from_partition(self, row: int, key):
+        rows = self._partition_rows[key]
+        del rows[bisect.bisect_left(rows, row)]
+        if not rows:
+            del self._partition_rows[key]
+        self._partitions.pop(key, None)
+
+    def _set_record(self, item_id: str, document: Optional[str], metadata: dict) -> int:
+        """Store one record's document and metadata, keeping its partition up to date."""
+        row = self._row.get(item_id)
+        is_new = row is None
+        if is_new:
+            row = self._row[item_id] = len(self._ids)
+            self._ids.append(item_id)
+            self._documents.append(None)
+            self._metadatas.append({})
+        old_key = self._partition_key(self._metadatas[row])
+        self._documents[row] = document
+        self._metadatas[row] = metadata
+        if self.partition_by:
+            new_key = self._partition_key(metadata)
+            if is_new:
+                self._add_to_partition(row, new_key)
+            elif new_key != old_key:
+                self._remove_from_partition(row, old_key)
+                self._add_to_partition(row, new_key)
+        return row
+
+    def _delete_record(self, item_id: str) -> bool:
+        row = self._row.pop(item_id, None)
+        if row is None:
+            return False
+        if self.partition_by:
+            self._remove_from_partition(row, self._partition_key(self._metadatas[row]))
+        self._deleted.add(row)
+        self._documents[row] = None
+        self._metadatas[row] = {}
+        return True
+
+    def _append_records(self, lines: List[str]):
+        with open(self._records_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _save_meta(self):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _embed(self, texts) -> np.ndarray:
+        if self.embedder is None:
+            raise ValueError("query_texts needs an embedder; pass query_embeddings instead")
+        return np.asarray(self.embedder.encode(list(texts)), dtype=np.float32)
+
+    @staticmethod
+    def _normalise(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _candidate_rows(self, where: Optional[dict]) -> np.ndarray:
+        """Rows that can satisfy `where`, using the partition map when possible."""
+        count = len(self._ids)
+        if not where:
+            return self._live(np.arange(count))
+        rows = None
+        rest = where
+        if self.partition_by and self.partition_by in where:
+            value = where[self.partition_by]
+            if isinstance(value, dict) and set(value) == {"$eq"}:
+                value = value["$eq"]
+            if not isinstance(value, dict):
+                rows = self._partitions.get(value)
+                if rows is None:
+                    rows = self._partitions[value] = np.asarray(self._partition_rows.get(value, []), dtype=np.int64)
+                rest = {k: v for k, v in where.items() if k != self.partition_by}
+        if rows is None:
+            rows = self._live(np.arange(count))
+        if rest:
+            rows = np.asarray([r for r in rows if matches_where(self._metadatas[r], rest)], dtype=np.int64)
+        return rows
+
+    def _live(self, rows: np.ndarray) -> np.ndarray:
+        if not self._deleted:
+            return rows
+        return rows[~np.isin(rows, np.fromiter(self._deleted, dtype=np.int64))]
+
+    # -- RetrievalBackend --
+    def count(self) -> int:
+        return len(self._row)
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        if embeddings is None:
+            embeddings = self._embed(documents)
+        vectors = self._normalise(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"embedding dim {vectors.shape[1]} does not match index dim {self.dim}")
+            if not os.path.exists(self._meta_path):
+                self._save_meta()
+            new_ids = [item_id for item_id in dict.fromkeys(ids) if item_id not in self._row]
+            self._ensure_capacity(len(self._ids) + len(new_ids))
+            lines = []
+            for i, item_id in enumerate(ids):
+                row = self._row.get(item_id)
+                # Fields that weren't passed keep their stored value, as in Chroma.
+                document = self._documents[row] if row is not None else None
+                metadata = self._metadatas[row] if row is not None else {}
+                if documents is not None:
+                    document = documents[i]
+                if metadatas is not None:
+                    metadata = metadatas[i] or {}
+                row = self._set_record(item_id, document, metadata)
+                self._matrix[row] = vectors[i]
+                lines.append(json.dumps({"id": item_id, "document": document, "metadata": metadata},
+                                        ensure_ascii=False))
+            # Vectors first: a crash before the log line leaves an unused row, not a record without a vector.
+            self._matrix.flush()
+            self._append_records(lines)
+
+    add = upsert
+
+    def delete(self, ids=None, where=None):
+        if ids is None and not where:
+            raise ValueError("delete needs ids or a where filter")
+        with self._lock:
+            if ids is not None:
+                targets = [item_id for item_id in dict.fromkeys(ids)
+                           if item_id in self._row and matches_where(self._metadatas[self._row[item_id]], where)]
+            else:
+                targets = [self._ids[r] for r in self._candidate_rows(where).tolist()]
+            targets = [item_id for item_id in targets if self._delete_record(item_id)]
+            if targets:
+                self._append_records([json.dumps({"id": item_id, "deleted": True}) for item_id in targets])
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")) -> dict:
+        with self._lock:
+            if ids is not None:
+                rows = [self._row[i] for i in ids if i in self._row]
+                rows = [r for r in rows if matches_where(self._metadatas[r], where)]
+            else:
+                rows = self._candidate_rows(where).tolist()
+            rows = rows[(offset or 0):]
+            if limit is not None:
+                rows = rows[:limit]
+            return {
+                "ids": [self._ids[r] for r in rows],
+                "documents": [self._documents[r] for r in rows] if "documents" in include else None,
+                "metadatas": [self._metadatas[r] for r in rows] if "metadatas" in include else None,
+                "embeddings": [np.array(self._matrix[r]) for r in rows] if "embeddings" in include else None,
+            }
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None,
+              include=("documents", "metadatas", "distances")) -> dict:
+        queries = self._embed(query_texts) if query_embeddings is None else np.asarray(query_embeddings, dtype=np.float32)
+        queries = self._normalise(queries.reshape(len(queries), -1))
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        with self._lock:
+            rows = self._candidate_rows(where)
+            if len(rows) == 0:
+                for field in result:
+                    result[field] = [[] for _ in range(len(queries))]
+                return result
+            vectors = self._matrix[rows] if len(rows) < len(self._ids) else self._matrix[:len(self._ids)]
+            # One GEMM for every query in the batch: (n_queries, dim) x (dim, n_rows)
+            similarities = queries @ vectors.T
+            k = min(n_results, len(rows))
+            for sims in similarities:
+                top = np.argpartition(-sims, k - 1)[:k] if k < len(sims) else np.arange(len(sims))
+                top = top[np.argsort(-sims[top])]
+                picked = rows[top]
+                result["ids"].append([self._ids[r] for r in picked])
+                result["documents"].append([self._documents[r] for r in picked])
+                result["metadatas"].append([self._metadatas[r] for r in picked])
+                result["distances"].append((1.0 - sims[top]).tolist())
+
+        for field in ("documents", "metadatas", "distances"):
+            if field not in include:
+                result[field] = None
+        return result
+
+
+def sync_from_collection(source, index: LocalVectorIndex, page_size: int = 500) -> int:
+    """Copy every record (with its stored embedding) from a Chroma collection into `index`."""
+    copied = 0
+    while True:
+        page = source.get(limit=page_size, offset=copied, include=["embeddings", "documents", "metadatas"])
+        if not page["ids"]:
+            break
+        index.upsert(page["ids"], embeddings=page["embeddings"], documents=page["documents"],
+                     metadatas=page["metadatas"])
+        copied += len(page["ids"])
+        print(f"Synced {copied} records...")
+    return copied
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] != ["sync"]:
+        print("Usage: python retrieval.py sync [index_dir]")
+        sys.exit(1)
+
+    from main import LOCAL_INDEX_DIR, connect_chroma_collection
+
+    index_dir = sys.argv[2] if len(sys.argv) > 2 else LOCAL_INDEX_DIR
+    copied = sync_from_collection(connect_chroma_collection(), LocalVectorIndex(index_dir))
+    print(f"Copied {copied} records into '{index_dir}'.")
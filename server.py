@@ -0,0 +1,173 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from main import (
+    RAGService,
+    retrieve_generation_contexts,
+    stream_chargesheet,
+    format_sse,
+    generate_case_chargesheet,
+)
+from jobs import JobQueue
+from metrics import render_metrics
+
+# --- CONFIGURATION ---
+# Blocking work (embedding, Chroma, LLM calls) never runs on the event loop;
+# it goes to these bounded pools so one slow request can't stall the rest.
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "8"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+OUTPUT_DIR = os.getenv("CHARGESHEET_OUTPUT_DIR", ".")
+
+
+# --- Pydantic Model ---
+class QueryRequest(BaseModel):
+    query: str
+
+class QueryResponse(BaseModel):
+    answer: str
+    retrieved_count: int
+
+
+# --- FastAPI App ---
+def create_app(rag_service: Optional[RAGService] = None) -> FastAPI:
+    """Build the API.
+
+    If no `rag_service` is passed it is created in a background thread at
+    startup. Either way it is only exposed once its embedding model has
+    loaded: until then (or for good, if loading failed) requests that need
+    it and /readyz get a 503, so load balancers only route traffic to warm
+    replicas.
+    """
+    started_at = time.perf_counter()  # time_to_ready counts from here
+    app = FastAPI(title="RAG Retrieval API")
+    app.rag_service = None  # Set once ready; RAGService in app context
+    app.startup_error = None
+    app.time_to_ready = None
+    app.query_executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="rag-query")
+    app.jobs = JobQueue(
+        lambda case_id, **options: generate_case_chargesheet(require_rag_service(), case_id, OUTPUT_DIR, **options),
+        max_workers=JOB_WORKERS
+    )
+
+    def load_rag_service():
+        try:
+            service = rag_service or RAGService()
+            print("RAG Service Initialized.")
+            service.wait_ready()
+            app.rag_service = service
+            app.time_to_ready = round(time.perf_counter() - started_at, 3)
+            print(f"Ready in {app.time_to_ready:.2f}s.")
+        except Exception as e:
+            app.startup_error = str(e)
+            print(f"ERROR initializing RAG Service: {e}")
+
+    def require_rag_service() -> RAGService:
+        if not app.rag_service:
+            detail = f"RAG Service failed to start: {app.startup_error}" if app.startup_error else "Service starting up..."
+            raise HTTPException(status_code=503, detail=detail)
+        return app.rag_service
+
+    async def run_blocking(func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(app.query_executor, func, *args)
+
+    @app.on_event("startup")
+    async def startup_event():
+        threading.Thread(target=load_rag_service, name="rag-init", daemon=True).start()
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        app.jobs.shutdown()
+        app.query_executor.shutdown(wait=False, cancel_futures=True)
+
+    @app.get("/healthz")
+    async def healthz():
+        """Liveness: the process is up and serving."""
+        return {"ready": app.time_to_ready is not None, "error": app.startup_error}
+
+    @app.get("/readyz")
+    async def readyz():
+        """Readiness: 200 once the retrieval backend and embedding model are loaded, 503 before."""
+        body = {"ready": app.time_to_ready is not None, "time_to_ready": app.time_to_ready,
+                "error": app.startup_error}
+        return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        """Prometheus scrape endpoint."""
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    @app.post("/query/{case_id}", response_model=QueryResponse)
+    async def query_case(case_id: str, request: QueryRequest):
+        rag_service = require_rag_service()
+        try:
+            answer = await run_blocking(rag_service.process_query, request.query, case_id)
+            return QueryResponse(answer=answer, retrieved_count=5)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @app.get("/chargesheet/{case_id}/stream")
+    async def stream_case_chargesheet(case_id: str, format: str = "sse"):
+        """Stream a generated chargesheet as SSE events (default) or plain chunked text."""
+        rag_service = require_rag_service()
+        context_text, section_contexts = await run_blocking(retrieve_generation_contexts, rag_service, case_id)
+        if not context_text and not any(section_contexts.values()):
+            raise HTTPException(status_code=404, detail=f"No case details found for {case_id}")
+
+        # Sync generators are iterated in Starlette's threadpool, off the event loop.
+        if format == "text":
+            def text_chunks():
+                for event, data in stream_chargesheet(context_text, case_id, section_contexts=section_contexts):
+                    if event == "section_start":
+                        yield data["header"]
+                    elif event == "token":
+                        yield data["text"]
+            return StreamingResponse(text_chunks(), media_type="text/plain; charset=utf-8")
+
+        events = (format_sse(event, data)
+                  for event, data in stream_chargesheet(context_text, case_id, section_contexts=section_contexts))
+        return StreamingResponse(events, media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.post("/chargesheet/{case_id}/jobs", status_code=202)
+    async def submit_chargesheet_job(case_id: str, incremental: bool = False):
+        """Queue a full generation; `?incremental=true` only redoes sections whose inputs changed."""
+        require_rag_service()
+        return app.jobs.submit(case_id, incremental=incremental).to_dict()
+
+    @app.get("/jobs/{job_id}")
+    async def job_status(job_id: str):
+        job = app.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+        return job.to_dict()
+
+    @app.get("/jobs/{job_id}/result")
+    async def job_result(job_id: str):
+        job = app.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+        if job.status == "failed":
+            raise HTTPException(status_code=500, detail=job.error)
+        if job.status != "completed":
+            raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+        return {"job_id": job.id, "case_id": job.case_id, "chargesheet": job.result}
+
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", "8000")))